@@ -5,9 +5,17 @@ import os
 sys.path.insert(0,'src')
 from import_obj import import_obj_model
 from export_obj import export_obj_model
-from import_dkr_binary import import_dkr_level_binary
+from import_dkr_binary import import_dkr_level_binary, open_dkr_level_binary
 from export_dkr_level_binary import export_dkr_level_binary
 from preview import preview_level
+from dkr_compression import DEFAULT_COMPRESSION_LEVEL
+from level_budget import analyze_level_budget
+from level_binary_patch import PATCH_EXTENSION, export_dkr_level_binary_patch, apply_dkr_level_binary_patch
+from model_split import SPLIT_MODES, SPLIT_ASSIGN_MODES, get_auto_splits, get_manual_splits
+from split_estimate import estimate_split_model
+from split_search import search_split_trees
+from model_textures import deduplicate_textures, prune_unused_textures
+from model_cache import MODEL_CACHE_EXTENSION, import_model_cache, export_model_cache
 sys.path.insert(0,'..')
 
 OBJ_EXTENSIONS = '.obj'
@@ -19,13 +27,36 @@ def load_model(args):
         return import_obj_model(args)
     elif lowerPath.endswith(LEVEL_BINARY_EXTENSIONS):
         return import_dkr_level_binary(args)
-    raise SystemExit('Invalid file path "' + lowerPath + '"; must end with .obj, .bin, or .cbin')
+    elif lowerPath.endswith(MODEL_CACHE_EXTENSION):
+        return import_model_cache(args)
+    raise SystemExit('Invalid file path "' + lowerPath + '"; must end with .obj, .bin, .cbin, or ' + MODEL_CACHE_EXTENSION)
+
+def analyze_model(args):
+    if args.input.lower().endswith(LEVEL_BINARY_EXTENSIONS):
+        with open_dkr_level_binary(args.input) as model: # Only the headers are needed.
+            analyze_level_budget(model, args)
+    else:
+        analyze_level_budget(load_model(args), args)
 
 def preview_model(args):
     preview_level(load_model(args))
 
+def dry_run_model(args):
+    model = load_model(args)
+    if args.autosplit >= 2:
+        splits, segmentBoundingBoxes = get_auto_splits(model, args.autosplit, args.splitmode)
+    else:
+        splits, segmentBoundingBoxes = get_manual_splits(model, args.manualsplit)
+    estimate_split_model(model, splits, segmentBoundingBoxes, args)
+
+def search_model_splits(args):
+    search_split_trees(load_model(args), args)
+
 def convert_model(args):
     model = load_model(args)
+    if args.prunetextures:
+        numRemoved = deduplicate_textures(model) + prune_unused_textures(model)
+        print('Removed ' + str(numRemoved) + ' duplicate/unused texture(s)')
     lowerPath = args.output.lower()
     print('Level scale set to ' +str(args.scale))
     if lowerPath.endswith(OBJ_EXTENSIONS):
@@ -34,6 +65,12 @@ def convert_model(args):
     elif lowerPath.endswith(LEVEL_BINARY_EXTENSIONS):
         print('Converting to Level Binary, Please wait...')
         return export_dkr_level_binary(model, args)
+    elif lowerPath.endswith(PATCH_EXTENSION):
+        print('Creating Level Binary patch, Please wait...')
+        return export_dkr_level_binary_patch(model, args)
+    elif lowerPath.endswith(MODEL_CACHE_EXTENSION):
+        print('Saving model cache, Please wait...')
+        return export_model_cache(model, args)
 
 def main():
     parser = argparse.ArgumentParser(description='Convert/Preview DKR Levels')
@@ -41,15 +78,70 @@ def main():
     parser.add_argument('-o', '--output', help='Output file path', required=False)
     parser.add_argument('-s', '--scale', type=int, default=1, help='How many blender units makes 1 ingame unit. Default is 1', required=False)
     parser.add_argument('-a', '--autosplit', type=int, default=0, help='Automatically splits a model into a number of segments. Value must be >= 2', required=False)
+    parser.add_argument('--splitmode', default='equal', choices=SPLIT_MODES, help='How --autosplit picks where to split. "equal" cuts the model in half recursively, "cost" picks the splits that keep the segments balanced with the fewest cut triangles and extra batches. Default is equal', required=False)
+    parser.add_argument('--savesplit', default=None, help='Used with --autosplit. Saves the splits to a JSON file that can be used with --manualsplit.', required=False)
+    parser.add_argument('--searchsplit', type=int, default=0, help='Instead of converting, tries out a number of ways to split the model into this many segments, and writes the best ones as JSON files for --manualsplit to the output directory, along with a report. Value must be >= 2', required=False)
+    parser.add_argument('--searchcandidates', type=int, default=64, help='Used with --searchsplit. Number of split trees to try. Default is 64', required=False)
+    parser.add_argument('--searchtop', type=int, default=5, help='Used with --searchsplit. Number of the best split trees to write. Default is 5', required=False)
     parser.add_argument('-m', '--manualsplit', default=None, help='Splits a model by a tree defined from a JSON file. Must be a path to a JSON file.', required=False)
+    parser.add_argument('-p', '--patchbase', default=None, help='Level binary that a ' + PATCH_EXTENSION + ' patch is made from, or applied to.', required=False)
+    parser.add_argument('--analyze', action='store_true', help='Writes a JSON report of how many bytes each part of the level binary takes up to the output path (or prints it), instead of converting.', required=False)
+    parser.add_argument('--dryrun', action='store_true', help='Used with --autosplit or --manualsplit. Instead of converting, writes a JSON report to the output path (or prints it) with an estimate of the triangles, vertices and batches of each segment, the triangles each split cuts, and the size of the level binary, without splitting the model.', required=False)
+    parser.add_argument('--maxsize', type=int, default=None, help='Used with --analyze or --dryrun. Fails if the level binary would be larger than this many bytes.', required=False)
+    parser.add_argument('-z', '--compressionlevel', type=int, default=DEFAULT_COMPRESSION_LEVEL, choices=range(0, 10), metavar='[0-9]', help='Compression level used when exporting a .cbin file. 0 is fastest, 9 is smallest. Default is ' + str(DEFAULT_COMPRESSION_LEVEL), required=False)
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of processes used to split a model into segments. 0 uses one per CPU. Default is 1', required=False)
+    parser.add_argument('--assign', default='clip', choices=SPLIT_ASSIGN_MODES, help='How triangles are put into segments when splitting. "clip" cuts triangles at the edges of the segments, "centroid" puts each whole triangle in the segment its middle is in, "overlap" puts it in the segment it overlaps the most. Whole triangles keep their vertex colors. Default is clip', required=False)
+    parser.add_argument('--splitcache', default=None, help='Directory to keep the segments built when splitting in, so that splitting again only rebuilds the segments that changed.', required=False)
+    parser.add_argument('--interpolatecolors', action='store_true', help='With --assign clip, gives vertices made by clipping a triangle the color of that point on the triangle, instead of white.', required=False)
+    parser.add_argument('--prunetextures', action='store_true', help='Merges identical textures and removes textures that are not used by any triangles before exporting.', required=False)
     args = parser.parse_args()
 
     if args.autosplit > 0 and args.manualsplit != None:
         raise SystemExit("Error: You cannot define both autosplit and manualsplit. Aborting!")
+    elif args.savesplit != None and args.autosplit < 2:
+        raise SystemExit("Error: --savesplit can only be used with --autosplit. Aborting!")
     elif args.manualsplit != None and not os.path.isfile(args.manualsplit):
         raise SystemExit('Error: Manual split file "' + args.manualsplit + '" does not exist. Aborting!')
-    
-    if args.output == None:
+
+    if args.searchsplit != 0:
+        if args.searchsplit < 2:
+            raise SystemExit('Error: --searchsplit must be >= 2. Aborting!')
+        elif args.autosplit > 0 or args.manualsplit != None:
+            raise SystemExit('Error: --searchsplit cannot be used with autosplit or manualsplit. Aborting!')
+        elif args.output == None:
+            raise SystemExit('Error: --searchsplit needs an output directory (-o). Aborting!')
+        elif args.searchcandidates < 1 or args.searchtop < 1:
+            raise SystemExit('Error: --searchcandidates and --searchtop must be >= 1. Aborting!')
+
+    if args.dryrun:
+        if args.autosplit < 2 and args.manualsplit == None:
+            raise SystemExit('Error: --dryrun needs --autosplit or --manualsplit. Aborting!')
+        elif args.analyze or args.searchsplit != 0:
+            raise SystemExit('Error: --dryrun cannot be used with --analyze or --searchsplit. Aborting!')
+
+    if args.splitcache != None and args.autosplit < 2 and args.manualsplit == None:
+        raise SystemExit('Error: --splitcache can only be used with --autosplit or --manualsplit. Aborting!')
+
+    if args.jobs < 0:
+        raise SystemExit('Error: The number of jobs cannot be negative. Aborting!')
+
+    usingPatch = args.input.lower().endswith(PATCH_EXTENSION) or (args.output != None and args.output.lower().endswith(PATCH_EXTENSION))
+    if usingPatch and args.patchbase == None:
+        raise SystemExit('Error: A ' + PATCH_EXTENSION + ' patch needs a base level binary (-p). Aborting!')
+    elif args.patchbase != None and not os.path.isfile(args.patchbase):
+        raise SystemExit('Error: Patch base file "' + args.patchbase + '" does not exist. Aborting!')
+
+    if args.analyze:
+        analyze_model(args)
+    elif args.dryrun:
+        dry_run_model(args)
+    elif args.searchsplit != 0:
+        search_model_splits(args)
+    elif args.input.lower().endswith(PATCH_EXTENSION):
+        if args.output == None or not args.output.lower().endswith(LEVEL_BINARY_EXTENSIONS):
+            raise SystemExit('Error: Applying a patch needs a level binary output path (-o). Aborting!')
+        apply_dkr_level_binary_patch(args)
+    elif args.output == None:
         preview_model(args)
     else:
         convert_model(args)
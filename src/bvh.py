@@ -0,0 +1,259 @@
+import numpy as np
+
+BVH_LEAF_SIZE = 8
+RAY_EPSILON = 0.000001
+
+def _dot(a, b):
+    return np.einsum('...i,...i->...', a, b)
+
+# Returns the point on each triangle (a, b, c) that is closest to each point p. All arrays are (K,3).
+# From "Real-Time Collision Detection" by Christer Ericson, 5.1.5
+def closest_points_on_triangles(p, a, b, c):
+    ab = b - a
+    ac = c - a
+    ap = p - a
+    bp = p - b
+    cp = p - c
+    d1 = _dot(ab, ap)
+    d2 = _dot(ac, ap)
+    d3 = _dot(ab, bp)
+    d4 = _dot(ac, bp)
+    d5 = _dot(ab, cp)
+    d6 = _dot(ac, cp)
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Inside the triangle
+        denom = va + vb + vc
+        denom = np.where(denom != 0, denom, 1.0)
+        out = a + ab * (vb / denom)[:, None] + ac * (vc / denom)[:, None]
+        # Edge regions, then vertex regions, so that the earlier checks win.
+        edgeBC = (va <= 0) & ((d4 - d3) >= 0) & ((d5 - d6) >= 0)
+        w = (d4 - d3) / np.where(edgeBC, (d4 - d3) + (d5 - d6), 1.0)
+        out = np.where(edgeBC[:, None], b + (c - b) * np.nan_to_num(w)[:, None], out)
+        edgeAC = (vb <= 0) & (d2 >= 0) & (d6 <= 0)
+        w = d2 / np.where(edgeAC, d2 - d6, 1.0)
+        out = np.where(edgeAC[:, None], a + ac * np.nan_to_num(w)[:, None], out)
+        edgeAB = (vc <= 0) & (d1 >= 0) & (d3 <= 0)
+        v = d1 / np.where(edgeAB, d1 - d3, 1.0)
+        out = np.where(edgeAB[:, None], a + ab * np.nan_to_num(v)[:, None], out)
+    out = np.where(((d6 >= 0) & (d5 <= d6))[:, None], c, out)
+    out = np.where(((d3 >= 0) & (d4 <= d3))[:, None], b, out)
+    out = np.where(((d1 <= 0) & (d2 <= 0))[:, None], a, out)
+    return out
+
+# Returns the distance along each ray to each triangle, or inf if it misses. Both sides of a triangle count, unless
+# `cullBackFaces` is set, in which case only triangles that are counter-clockwise from the ray's side are hit.
+# Moller-Trumbore intersection; all arrays are (K,3).
+def intersect_rays_with_triangles(origins, directions, a, b, c, cullBackFaces=False):
+    e1 = b - a
+    e2 = c - a
+    pvec = np.cross(directions, e2)
+    det = _dot(e1, pvec)
+    valid = (det if cullBackFaces else np.abs(det)) > RAY_EPSILON
+    invDet = 1.0 / np.where(valid, det, 1.0)
+    tvec = origins - a
+    u = _dot(tvec, pvec) * invDet
+    qvec = np.cross(tvec, e1)
+    v = _dot(directions, qvec) * invDet
+    t = _dot(e2, qvec) * invDet
+    hit = valid & (u >= 0) & (u <= 1) & (v >= 0) & (u + v <= 1) & (t >= 0)
+    return np.where(hit, t, np.inf)
+
+# A bounding volume hierarchy over triangles, for ray casts, box queries and nearest triangle queries.
+# Nodes are kept in arrays: nodeMin/nodeMax are the bounds of each node, leaves have nodeLeft == -1 and cover
+# triangles triOrder[nodeStart:nodeStart + nodeCount], and inner nodes have two children. Node 0 is the root.
+# Every query works on a batch of rays/boxes/points at once, and returns triangle indices into `triPositions`.
+class TriangleBVH:
+    def __init__(self, triPositions, leafSize=BVH_LEAF_SIZE):
+        self.triPositions = np.asarray(triPositions, dtype=np.float64).reshape(-1, 3, 3)
+        self.triMin = self.triPositions.min(axis=1)
+        self.triMax = self.triPositions.max(axis=1)
+        self.leafSize = max(1, leafSize)
+        self._build()
+
+    # Builds a BVH over every triangle in a segment. Triangle indices are the segment's triangle indices.
+    @staticmethod
+    def from_segment(segment, leafSize=BVH_LEAF_SIZE):
+        return TriangleBVH(segment.get_triangle_positions(), leafSize)
+
+    # Builds a BVH over every triangle in the level. `triSegments` and `triIndices` give the segment and the triangle
+    # within that segment for each of the BVH's triangle indices.
+    @staticmethod
+    def from_model(model, leafSize=BVH_LEAF_SIZE):
+        positions = [segment.get_triangle_positions() for segment in model.segments]
+        bvh = TriangleBVH(np.concatenate(positions) if len(positions) > 0 else np.zeros((0, 3, 3)), leafSize)
+        bvh.triSegments = np.concatenate([np.full(len(p), i, dtype=np.int64) for i, p in enumerate(positions)] + [np.zeros(0, dtype=np.int64)])
+        bvh.triIndices = np.concatenate([np.arange(len(p), dtype=np.int64) for p in positions] + [np.zeros(0, dtype=np.int64)])
+        return bvh
+
+    # Median split on the longest axis of the triangle centers.
+    def _build(self):
+        numTriangles = len(self.triPositions)
+        centers = (self.triMin + self.triMax) * 0.5
+        self.triOrder = np.arange(numTriangles, dtype=np.int64)
+        nodeLeft = []
+        nodeRight = []
+        nodeStart = []
+        nodeCount = []
+        stack = [(-1, False, 0, numTriangles)]
+        while len(stack) > 0:
+            parent, isRight, start, end = stack.pop()
+            nodeIndex = len(nodeLeft)
+            if parent != -1:
+                if isRight:
+                    nodeRight[parent] = nodeIndex
+                else:
+                    nodeLeft[parent] = nodeIndex
+            triangles = self.triOrder[start:end]
+            nodeLeft.append(-1)
+            nodeRight.append(-1)
+            nodeStart.append(start)
+            nodeCount.append(end - start)
+            if end - start <= self.leafSize:
+                continue
+            triCenters = centers[triangles]
+            axis = int(np.argmax(triCenters.max(axis=0) - triCenters.min(axis=0)))
+            middle = (end - start) // 2
+            self.triOrder[start:end] = triangles[np.argpartition(triCenters[:, axis], middle, kind='introselect')]
+            stack.append((nodeIndex, True, start + middle, end))
+            stack.append((nodeIndex, False, start, start + middle))
+        self.nodeLeft = np.array(nodeLeft, dtype=np.int64)
+        self.nodeRight = np.array(nodeRight, dtype=np.int64)
+        self.nodeStart = np.array(nodeStart, dtype=np.int64)
+        self.nodeCount = np.array(nodeCount, dtype=np.int64)
+        self._build_bounds()
+
+    # Leaves cover a contiguous range of triOrder, so their bounds are found in one go. Children always come after
+    # their parent, so going backwards fills in each inner node after both of its children.
+    def _build_bounds(self):
+        numNodes = len(self.nodeLeft)
+        self.nodeMin = np.full((numNodes, 3), np.inf)
+        self.nodeMax = np.full((numNodes, 3), -np.inf)
+        leaves = np.flatnonzero((self.nodeLeft == -1) & (self.nodeCount > 0))
+        if len(leaves) > 0:
+            # reduceat needs increasing offsets, so sort the leaves by where they start.
+            leaves = leaves[np.argsort(self.nodeStart[leaves])]
+            starts = self.nodeStart[leaves]
+            self.nodeMin[leaves] = np.minimum.reduceat(self.triMin[self.triOrder], starts, axis=0)
+            self.nodeMax[leaves] = np.maximum.reduceat(self.triMax[self.triOrder], starts, axis=0)
+        innerNodes = np.flatnonzero(self.nodeLeft != -1)[::-1].tolist()
+        nodeMin = self.nodeMin
+        nodeMax = self.nodeMax
+        for node in innerNodes:
+            left = self.nodeLeft[node]
+            right = self.nodeRight[node]
+            nodeMin[node] = np.minimum(nodeMin[left], nodeMin[right])
+            nodeMax[node] = np.maximum(nodeMax[left], nodeMax[right])
+
+    # Walks the tree for a batch of queries. `visit_node(node, queries)` returns the queries that should carry on into
+    # the node, and `visit_leaf(triangles, queries)` is called for each leaf with the queries that reached it.
+    def _traverse(self, numQueries, visit_node, visit_leaf):
+        if len(self.triOrder) == 0 or numQueries == 0:
+            return
+        stack = [(0, np.arange(numQueries))]
+        while len(stack) > 0:
+            node, queries = stack.pop()
+            queries = visit_node(node, queries)
+            if len(queries) == 0:
+                continue
+            if self.nodeLeft[node] == -1:
+                start = self.nodeStart[node]
+                visit_leaf(self.triOrder[start:start + self.nodeCount[node]], queries)
+            else:
+                stack.append((self.nodeRight[node], queries))
+                stack.append((self.nodeLeft[node], queries))
+
+    # Returns a sorted array of the triangles whose bounds overlap each box, as a list with one array per box.
+    # Boxes are grown by `epsilon` on every side, so triangles that only touch a box are included.
+    def query_boxes(self, boxMins, boxMaxs, epsilon=0.0):
+        boxMins = np.asarray(boxMins, dtype=np.float64).reshape(-1, 3) - epsilon
+        boxMaxs = np.asarray(boxMaxs, dtype=np.float64).reshape(-1, 3) + epsilon
+        results = [[] for _ in range(0, len(boxMins))]
+
+        def visit_node(node, queries):
+            overlaps = (boxMins[queries] <= self.nodeMax[node]).all(axis=1) & (boxMaxs[queries] >= self.nodeMin[node]).all(axis=1)
+            return queries[overlaps]
+
+        def visit_leaf(triangles, queries):
+            overlaps = (boxMins[queries][:, None, :] <= self.triMax[triangles][None, :, :]).all(axis=2)
+            overlaps &= (boxMaxs[queries][:, None, :] >= self.triMin[triangles][None, :, :]).all(axis=2)
+            for i, query in enumerate(queries.tolist()):
+                results[query].append(triangles[overlaps[i]])
+
+        self._traverse(len(boxMins), visit_node, visit_leaf)
+        return [np.sort(np.concatenate(result)) if len(result) > 0 else np.zeros(0, dtype=np.int64) for result in results]
+
+    def query_box(self, boxMin, boxMax, epsilon=0.0):
+        return self.query_boxes([boxMin], [boxMax], epsilon)[0]
+
+    # Returns (triangles, distances) for the first triangle hit by each ray, with -1 and inf for rays that miss.
+    # Directions don't need to be normalized; distances are in multiples of the direction. With `cullBackFaces`, only
+    # the front (counter-clockwise) sides of triangles are hit.
+    def ray_cast(self, origins, directions, maxDistance=np.inf, cullBackFaces=False):
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        hitTriangles = np.full(len(origins), -1, dtype=np.int64)
+        hitDistances = np.full(len(origins), float(maxDistance))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            invDirections = 1.0 / directions
+
+        def visit_node(node, queries):
+            # Slab test against the node's bounds.
+            with np.errstate(invalid='ignore'):
+                t0 = (self.nodeMin[node] - origins[queries]) * invDirections[queries]
+                t1 = (self.nodeMax[node] - origins[queries]) * invDirections[queries]
+            # A ray that is parallel to a slab and starts on its plane gives nan; treat that as inside.
+            tNear = np.nan_to_num(np.minimum(t0, t1), nan=-np.inf).max(axis=1)
+            tFar = np.nan_to_num(np.maximum(t0, t1), nan=np.inf).min(axis=1)
+            hits = (tNear <= tFar) & (tFar >= 0) & (tNear <= hitDistances[queries])
+            return queries[hits]
+
+        def visit_leaf(triangles, queries):
+            rays = np.repeat(queries, len(triangles))
+            tris = np.tile(triangles, len(queries))
+            corners = self.triPositions[tris]
+            distances = intersect_rays_with_triangles(origins[rays], directions[rays], corners[:, 0], corners[:, 1], corners[:, 2], cullBackFaces)
+            distances = distances.reshape(len(queries), len(triangles))
+            # Ties go to the lowest triangle index.
+            distances = np.where(distances <= hitDistances[queries][:, None], distances, np.inf)
+            order = np.lexsort((np.broadcast_to(triangles, distances.shape), distances), axis=1)[:, 0]
+            best = distances[np.arange(len(queries)), order]
+            bestTriangles = triangles[order]
+            closer = (best < hitDistances[queries]) | ((best == hitDistances[queries]) & (best != np.inf) & ((hitTriangles[queries] == -1) | (bestTriangles < hitTriangles[queries])))
+            hitDistances[queries[closer]] = best[closer]
+            hitTriangles[queries[closer]] = bestTriangles[closer]
+
+        self._traverse(len(origins), visit_node, visit_leaf)
+        hitDistances[hitTriangles == -1] = np.inf
+        return (hitTriangles, hitDistances)
+
+    # Returns (triangles, distances) for the triangle closest to each point, with -1 and inf if there are no triangles
+    # within `maxDistance`. Ties go to the lowest triangle index.
+    def nearest_triangles(self, points, maxDistance=np.inf):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        bestTriangles = np.full(len(points), -1, dtype=np.int64)
+        bestDistances = np.full(len(points), float(maxDistance) ** 2 if maxDistance != np.inf else np.inf)
+
+        def visit_node(node, queries):
+            offsets = np.maximum(self.nodeMin[node] - points[queries], 0) + np.maximum(points[queries] - self.nodeMax[node], 0)
+            return queries[_dot(offsets, offsets) <= bestDistances[queries]]
+
+        def visit_leaf(triangles, queries):
+            pointIndices = np.repeat(queries, len(triangles))
+            tris = np.tile(triangles, len(queries))
+            corners = self.triPositions[tris]
+            closest = closest_points_on_triangles(points[pointIndices], corners[:, 0], corners[:, 1], corners[:, 2])
+            offsets = closest - points[pointIndices]
+            distances = _dot(offsets, offsets).reshape(len(queries), len(triangles))
+            order = np.lexsort((np.broadcast_to(triangles, distances.shape), distances), axis=1)[:, 0]
+            best = distances[np.arange(len(queries)), order]
+            bestTris = triangles[order]
+            current = bestDistances[queries]
+            closer = (best < current) | ((best == current) & (best != np.inf) & ((bestTriangles[queries] == -1) | (bestTris < bestTriangles[queries])))
+            bestDistances[queries[closer]] = best[closer]
+            bestTriangles[queries[closer]] = bestTris[closer]
+
+        self._traverse(len(points), visit_node, visit_leaf)
+        return (bestTriangles, np.where(bestTriangles != -1, np.sqrt(bestDistances), np.inf))
@@ -0,0 +1,54 @@
+import numpy as np
+
+EDGE_CORNERS = [(0, 1), (1, 2), (2, 0)]
+
+# Returns the neighbouring triangle across each edge (01, 12, 20) of every triangle, as a (T,3) array.
+# `triPositions` is a (T,3,3) array with the positions of each triangle's corners.
+#
+# Another triangle is a neighbour across an edge if both of the edge's corners are at one of its corners. When
+# there is more than one, the one with the lowest index wins, and a triangle with no neighbour uses its own index.
+# This is the same as Model3DSegment.get_collision_data_for_triangle(), but in a single O(T log T) pass: every
+# triangle adds a key for each pair of its corner positions (and each single position, for degenerate edges),
+# then each edge looks up the two lowest triangles with its key.
+#
+# Only depends on NumPy arrays, so it can be run on segments separately (e.g. in other processes).
+def get_collision_neighbours(triPositions):
+    triPositions = np.asarray(triPositions).reshape(-1, 3, 3)
+    numTriangles = len(triPositions)
+    neighbours = np.repeat(np.arange(numTriangles, dtype=np.int64)[:, None], 3, axis=1)
+    if numTriangles == 0:
+        return neighbours
+
+    # Give every distinct position an id.
+    positionIds = np.unique(triPositions.reshape(-1, 3), axis=0, return_inverse=True)[1].reshape(-1, 3).astype(np.int64)
+    numIds = int(positionIds.max()) + 1
+
+    def get_keys(a, b):
+        return np.minimum(a, b) * numIds + np.maximum(a, b)
+
+    # Every pair of corners, and every corner paired with itself.
+    keys = [get_keys(positionIds[:, a], positionIds[:, b]) for a, b in EDGE_CORNERS]
+    keys += [get_keys(positionIds[:, a], positionIds[:, a]) for a in range(0, 3)]
+    keys = np.concatenate(keys)
+    triIndices = np.tile(np.arange(numTriangles, dtype=np.int64), 6)
+
+    # Sort by key and then by triangle, and remove repeats of the same triangle within a key.
+    order = np.lexsort((triIndices, keys))
+    keys = keys[order]
+    triIndices = triIndices[order]
+    isRepeat = np.zeros(len(keys), dtype=bool)
+    isRepeat[1:] = (keys[1:] == keys[:-1]) & (triIndices[1:] == triIndices[:-1])
+    keys = keys[~isRepeat]
+    triIndices = triIndices[~isRepeat]
+
+    # The first and second (if any) triangles for each key.
+    uniqueKeys, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+    firstTris = triIndices[starts]
+    secondTris = np.where(counts > 1, triIndices[np.minimum(starts + 1, len(triIndices) - 1)], -1)
+
+    for edge, (a, b) in enumerate(EDGE_CORNERS):
+        keyIndices = np.searchsorted(uniqueKeys, get_keys(positionIds[:, a], positionIds[:, b]))
+        triangles = np.arange(numTriangles)
+        found = np.where(firstTris[keyIndices] != triangles, firstTris[keyIndices], secondTris[keyIndices])
+        neighbours[:, edge] = np.where(found != -1, found, triangles)
+    return neighbours
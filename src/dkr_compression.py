@@ -0,0 +1,54 @@
+import zlib
+
+COMPRESSED_LEVEL_BINARY_EXTENSION = '.cbin'
+
+# Compressed DKR assets start with a 5 byte header. The first 4 bytes are the uncompressed size as a
+# little-endian integer. The game skips the 5th byte, so the compression level is stored there.
+# The rest of the file is a raw DEFLATE stream.
+COMPRESSED_HEADER_SIZE = 5
+COMPRESSION_CHUNK_SIZE = 0x10000
+DEFAULT_COMPRESSION_LEVEL = 9
+
+def is_compressed_level_binary_path(path):
+    return path.lower().endswith(COMPRESSED_LEVEL_BINARY_EXTENSION)
+
+# Streams a compressed file straight into a buffer of the uncompressed size, one chunk at a time.
+def read_compressed_file(path):
+    with open(path, 'rb') as compressedFile:
+        header = compressedFile.read(COMPRESSED_HEADER_SIZE)
+        if len(header) < COMPRESSED_HEADER_SIZE:
+            raise SystemExit('Error: "' + path + '" is too small to be a compressed file.')
+        uncompressedSize = int.from_bytes(header[0:4], 'little')
+        out = bytearray(uncompressedSize)
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        offset = 0
+        try:
+            while not decompressor.eof:
+                chunk = compressedFile.read(COMPRESSION_CHUNK_SIZE)
+                if len(chunk) == 0:
+                    break
+                while len(chunk) > 0 and not decompressor.eof:
+                    # Limit the output, so that a bad header can't make us write past the end of the buffer.
+                    data = decompressor.decompress(chunk, max(uncompressedSize - offset, 1))
+                    if offset + len(data) > uncompressedSize:
+                        raise SystemExit('Error: "' + path + '" is larger than its header says it is.')
+                    out[offset:offset + len(data)] = data
+                    offset += len(data)
+                    chunk = decompressor.unconsumed_tail
+        except zlib.error as err:
+            raise SystemExit('Error: Could not decompress "' + path + '": ' + str(err))
+        if not decompressor.eof or offset != uncompressedSize:
+            raise SystemExit('Error: "' + path + '" is truncated or corrupted.')
+    return out
+
+# `data` can be any bytes-like object; it is compressed and written out one chunk at a time.
+def write_compressed_file(path, data, level=DEFAULT_COMPRESSION_LEVEL):
+    if level < 0 or level > 9:
+        raise SystemExit('Error: Compression level must be between 0 and 9, not ' + str(level))
+    view = memoryview(data).cast('B')
+    with open(path, 'wb') as compressedFile:
+        compressedFile.write(len(view).to_bytes(4, 'little') + bytes([level]))
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        for offset in range(0, len(view), COMPRESSION_CHUNK_SIZE):
+            compressedFile.write(compressor.compress(view[offset:offset + COMPRESSION_CHUNK_SIZE]))
+        compressedFile.write(compressor.flush())
@@ -0,0 +1,87 @@
+import numpy as np
+from util import *
+
+# Big-endian record layouts of the DKR level binary. Field offsets that are not
+# listed are unknown, and are left as zero by the exporter.
+
+def _record(fields, itemSize):
+    names = [field[0] for field in fields]
+    formats = [field[1] for field in fields]
+    offsets = [field[2] for field in fields]
+    dtype = np.dtype({ 'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': itemSize })
+    assert dtype.itemsize == itemSize
+    return dtype
+
+LEVEL_HEADER_DTYPE = _record([
+    ('texturesOffset',  '>u4', 0x00),
+    ('segmentsOffset',  '>u4', 0x04),
+    ('bboxesOffset',    '>u4', 0x08),
+    ('collisionOffset', '>u4', 0x0C),
+    ('bitfieldsOffset', '>u4', 0x10),
+    ('bspTreeOffset',   '>u4', 0x14),
+    ('numTextures',     '>u2', 0x18),
+    ('numSegments',     '>u2', 0x1A),
+    ('boundaryX',       '>u4', 0x3C),
+    ('boundaryY',       '>u4', 0x40),
+    ('boundaryZ',       '>u4', 0x44),
+    ('fileSize',        '>u4', 0x48),
+], SIZE_OF_LEVEL_HEADER)
+
+TEXTURE_NODE_DTYPE = _record([
+    ('originalTexIndex', '>u4', 0x00),
+    ('width',            'u1',  0x04),
+    ('height',           'u1',  0x05),
+    ('format',           'u1',  0x06),
+    ('collisionType',    'u1',  0x07),
+], SIZE_OF_TEXTURE_NODE)
+
+SEGMENT_DTYPE = _record([
+    ('verticesOffset',  '>u4', 0x00),
+    ('trianglesOffset', '>u4', 0x04),
+    ('batchesOffset',   '>u4', 0x0C),
+    ('collisionOffset', '>u4', 0x14),
+    ('numVertices',     '>u2', 0x1C),
+    ('numTriangles',    '>u2', 0x1E),
+    ('numBatches',      '>u2', 0x20),
+    ('bitfieldOffset',  '>u2', 0x28),
+    ('numBatchesByte',  'u1',  0x40), # ???
+], SIZE_OF_SEGMENT)
+
+VERTEX_DTYPE = _record([
+    ('position', ('>i2', (3,)), 0x00),
+    ('color',    ('u1', (4,)),  0x06),
+], SIZE_OF_VERTEX)
+
+TRIANGLE_DTYPE = _record([
+    ('flags',   'u1',             0x00),
+    ('indices', ('u1', (3,)),     0x01),
+    ('uvs',     ('>i2', (3, 2)),  0x04),
+], SIZE_OF_TRIANGLE)
+
+BATCH_DTYPE = _record([
+    ('texIndex',   'i1',  0x00),
+    ('vertOffset', '>u2', 0x02),
+    ('triOffset',  '>u2', 0x04),
+    ('flags',      '>u4', 0x08),
+], SIZE_OF_BATCH_INFO)
+
+BOUNDING_BOX_DTYPE = _record([
+    ('min', ('>i2', (3,)), 0x00),
+    ('max', ('>i2', (3,)), 0x06),
+], SIZE_OF_BOUNDING_BOX)
+
+COLLISION_NODE_DTYPE = _record([
+    ('triIndex',   '>u2',         0x00),
+    ('neighbours', ('>u2', (3,)), 0x02),
+], SIZE_OF_COLLISION_NODE)
+
+BSP_TREE_NODE_DTYPE = _record([
+    ('leftIndex',     '>i2', 0x00),
+    ('rightIndex',    '>i2', 0x02),
+    ('splitAxis',     'u1',  0x04),
+    ('segmentNumber', 'u1',  0x05),
+    ('splitValue',    '>i2', 0x06),
+], SIZE_OF_BSP_TREE_NODE)
+
+def read_records(data, dtype, offset, count):
+    return np.frombuffer(data, dtype=dtype, count=count, offset=offset)
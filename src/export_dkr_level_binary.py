@@ -1,74 +1,9 @@
 from model import *
+from model_columnar import to_columnar
+from dkr_level_binary_format import *
+from dkr_compression import is_compressed_level_binary_path, write_compressed_file
 import math
-
-def write8(data, offset, val):
-    data[offset] = val & 0xFF
-
-def write16(data, offset, val):
-    write8(data, offset, val >> 8)
-    write8(data, offset + 1, val)
-
-def write32(data, offset, val):
-    write16(data, offset, val >> 16)
-    write16(data, offset + 2, val)
-
-def write_texture(data, offset, texture):
-    if texture.originalTexIndex != -1:
-        write32(data, offset + 0, texture.originalTexIndex)
-    else:
-        print('Warning: Custom Textures are current not supported yet!')
-        write32(data, offset + 0, 0)
-    write8(data, offset + 4, texture.width)
-    write8(data, offset + 5, texture.height)
-    write8(data, offset + 6, texture.format)
-    write8(data, offset + 7, texture.collisionType)
-
-def write_vertex(data, offset, vertex):
-    write16(data, offset + 0, vertex.x)
-    write16(data, offset + 2, vertex.y)
-    write16(data, offset + 4, vertex.z)
-    write8(data, offset + 6, vertex.color.r)
-    write8(data, offset + 7, vertex.color.g)
-    write8(data, offset + 8, vertex.color.b)
-    write8(data, offset + 9, vertex.color.a)
-
-def write_uv(data, offset, uv, tex):
-    write16(data, offset + 0, uv.get_u(tex.width))
-    write16(data, offset + 2, uv.get_v(tex.height))
-
-def write_triangle(data, offset, tri, tex):
-    write8(data, offset + 0, tri.flags)
-    write8(data, offset + 1, tri.vi0)
-    write8(data, offset + 2, tri.vi1)
-    write8(data, offset + 3, tri.vi2)
-    if tex != None:
-        write_uv(data, offset + 4, tri.uv0, tex)
-        write_uv(data, offset + 8, tri.uv1, tex)
-        write_uv(data, offset + 12, tri.uv2, tex)
-    else:
-        write32(data, offset + 4, 0)
-        write32(data, offset + 8, 0)
-        write32(data, offset + 12, 0)
-
-def write_batch(data, offset, batch):
-    write8(data, offset + 0, batch.texIndex)
-    write16(data, offset + 2, batch.vertOffset)
-    write16(data, offset + 4, batch.triOffset)
-    write32(data, offset + 8, batch.flags)
-
-def write_bounding_box(data, offset, bbox):
-    write16(data, offset + 0, bbox[0][0])
-    write16(data, offset + 2, bbox[0][1])
-    write16(data, offset + 4, bbox[0][2])
-    write16(data, offset + 6, bbox[1][0])
-    write16(data, offset + 8, bbox[1][1])
-    write16(data, offset + 10, bbox[1][2])
-
-def write_collision_data(data, offset, triIndex, tri0, tri1, tri2):
-    write16(data, offset + 0, triIndex)
-    write16(data, offset + 2, tri0)
-    write16(data, offset + 4, tri1)
-    write16(data, offset + 6, tri2)
+import numpy as np
 
 SPLIT_AXIS_VALUES = {
     'X': 0,
@@ -76,205 +11,253 @@ SPLIT_AXIS_VALUES = {
     'Z': 2
 }
 
-def write_bsp_tree_node_data(data, offset, leftIndex, rightIndex, splitAxis, segmentNumber, splitValue):
-    write16(data, offset + 0, leftIndex)
-    write16(data, offset + 2, rightIndex)
-    write8(data, offset + 4, SPLIT_AXIS_VALUES[splitAxis])
-    write8(data, offset + 5, segmentNumber)
-    write16(data, offset + 6, splitValue)
-
-def write_bsp_tree_node(data, index, node):
-    if index == -1 or node == None:
+# Byte offsets and sizes of one segment's data, relative to the start of the file.
+class SegmentLayout:
+    def __init__(self, numVertices, numTriangles, numBatches):
+        self.numVertices = numVertices
+        self.numTriangles = numTriangles
+        self.numBatches = numBatches
+        self.batchesSize = align8((numBatches + 1) * SIZE_OF_BATCH_INFO)
+        self.trianglesSize = numTriangles * SIZE_OF_TRIANGLE
+        self.verticesSize = align8(numVertices * SIZE_OF_VERTEX)
+        self.collisionSize = numTriangles * SIZE_OF_COLLISION_NODE
+        self.batchesOffset = 0
+        self.trianglesOffset = 0
+        self.verticesOffset = 0
+        self.collisionOffset = 0
+
+# Works out where every section of the level binary goes, before any of it gets written.
+class LevelBinaryLayout:
+    def __init__(self, numTextures, segmentCounts, hasBspTree):
+        numSegments = len(segmentCounts)
+        self.numTextures = numTextures
+        self.numSegments = numSegments
+        self.hasBspTree = hasBspTree and numSegments > 1
+        self.numBytesPerBitfield = math.ceil(numSegments / 8)
+        self.segments = [SegmentLayout(v, t, b) for v, t, b in segmentCounts]
+
+        self.texturesOffset = SIZE_OF_LEVEL_HEADER
+        self.texturesSize = numTextures * SIZE_OF_TEXTURE_NODE
+
+        self.segmentsOffset = self.texturesOffset + self.texturesSize
+        self.segmentHeadersSize = align16(numSegments * SIZE_OF_SEGMENT) + (self.segmentsOffset % 16)
+        offset = self.segmentsOffset + self.segmentHeadersSize
+        for segment in self.segments:
+            segment.batchesOffset = offset
+            offset += segment.batchesSize
+            segment.trianglesOffset = offset
+            offset += segment.trianglesSize
+            segment.verticesOffset = offset
+            offset += segment.verticesSize
+        self.segmentsSize = offset - self.segmentsOffset
+
+        self.bboxesOffset = offset
+        self.bboxesSize = numSegments * SIZE_OF_BOUNDING_BOX
+
+        self.bspTreeOffset = self.bboxesOffset + self.bboxesSize
+        if self.hasBspTree:
+            self.bspTreeSize = align16((numSegments - 1) * SIZE_OF_BSP_TREE_NODE)
+        else:
+            self.bspTreeSize = SIZE_OF_BSP_TREE_NODE # A single blank node.
+
+        self.bitfieldsOffset = self.bspTreeOffset + self.bspTreeSize
+        if self.hasBspTree:
+            self.bitfieldsSize = self.numBytesPerBitfield * numSegments
+        else:
+            self.bitfieldsSize = 16 # A single blank bitfield.
+
+        self.collisionOffset = self.bitfieldsOffset + self.bitfieldsSize
+        offset = self.collisionOffset
+        for segment in self.segments:
+            segment.collisionOffset = offset
+            offset += segment.collisionSize
+        self.collisionSize = offset - self.collisionOffset
+
+        self.fileSize = offset
+
+    @staticmethod
+    def from_model(model):
+        segmentCounts = [seg.get_counts() for seg in model.segments]
+        return LevelBinaryLayout(len(model.textures), segmentCounts, model.bspTree.get_num_nodes() > 0)
+
+    # Returns None if the binary was not laid out the same way this exporter would lay it out.
+    @staticmethod
+    def from_binary(data):
+        if len(data) < SIZE_OF_LEVEL_HEADER:
+            return None
+        header = read_records(data, LEVEL_HEADER_DTYPE, 0, 1)[0]
+        numSegments = int(header['numSegments'])
+        segmentsOffset = int(header['segmentsOffset'])
+        if segmentsOffset + (numSegments * SIZE_OF_SEGMENT) > len(data):
+            return None
+        segmentHeaders = read_records(data, SEGMENT_DTYPE, segmentsOffset, numSegments)
+        segmentCounts = [(int(seg['numVertices']), int(seg['numTriangles']), int(seg['numBatches'])) for seg in segmentHeaders]
+        layout = LevelBinaryLayout(int(header['numTextures']), segmentCounts, True)
+        if layout.fileSize != len(data) or layout.segmentsOffset != segmentsOffset or layout.collisionOffset != int(header['collisionOffset']):
+            return None
+        return layout
+
+def _get_records(out, offset, dtype, count):
+    return out[offset:offset + (count * dtype.itemsize)].view(dtype)
+
+def _as_array(values, numColumns):
+    return np.array(values, dtype=np.int64).reshape(-1, numColumns)
+
+def write_texture_nodes_data(out, layout, model):
+    nodes = _get_records(out, layout.texturesOffset, TEXTURE_NODE_DTYPE, layout.numTextures)
+    originalTexIndices = []
+    for texture in model.textures:
+        if texture.originalTexIndex != -1:
+            originalTexIndices.append(texture.originalTexIndex)
+        else:
+            print('Warning: Custom Textures are current not supported yet!')
+            originalTexIndices.append(0)
+    values = _as_array([(tex.width, tex.height, tex.format, tex.collisionType) for tex in model.textures], 4)
+    nodes['originalTexIndex'] = _as_array(originalTexIndices, 1)[:, 0]
+    nodes['width'] = values[:, 0]
+    nodes['height'] = values[:, 1]
+    nodes['format'] = values[:, 2]
+    nodes['collisionType'] = values[:, 3]
+
+# Returns the texture index used by each triangle in the segment.
+def get_triangle_texture_indices(segment):
+    segment = to_columnar(segment)
+    batchIndices = segment.get_triangle_batch_indices()
+    missing = np.flatnonzero(batchIndices == -1)
+    if len(missing) > 0:
+        raise SystemExit('Error Invalid triangle index "' + str(int(missing[0])) + '"')
+    return segment.batchTexIndices[batchIndices]
+
+def get_triangle_uvs(segment, textures):
+    segment = to_columnar(segment)
+    texIndices = get_triangle_texture_indices(segment)
+    texSizes = np.zeros((len(texIndices), 2))
+    hasTexture = texIndices != -1
+    for texIndex in np.unique(texIndices[hasTexture]).tolist():
+        tex = textures[texIndex]
+        texSizes[texIndices == texIndex] = (tex.width, tex.height)
+    # Same as UV.get_u() and UV.get_v()
+    uvs = np.clip(np.trunc(segment.triUVs * texSizes[:, None, :] * 32.0), -32768, 32767).astype(np.int64)
+    uvs[~hasTexture] = 0
+    return uvs
+
+def write_segment_data(out, segmentLayout, segment, textures):
+    segment = to_columnar(segment)
+    numVertices = segmentLayout.numVertices
+    numTriangles = segmentLayout.numTriangles
+    numBatches = segmentLayout.numBatches
+
+    # The last batch marks the end of the vertices and triangles.
+    batches = _get_records(out, segmentLayout.batchesOffset, BATCH_DTYPE, numBatches + 1)
+    batches['texIndex'] = np.append(segment.batchTexIndices, -1)
+    batches['vertOffset'] = np.append(segment.batchVertOffsets, numVertices)
+    batches['triOffset'] = np.append(segment.batchTriOffsets, numTriangles)
+    batches['flags'] = np.append(segment.batchFlags, 0)
+
+    triangles = _get_records(out, segmentLayout.trianglesOffset, TRIANGLE_DTYPE, numTriangles)
+    triangles['flags'] = segment.triFlags
+    triangles['indices'] = segment.triIndices
+    triangles['uvs'] = get_triangle_uvs(segment, textures)
+
+    vertices = _get_records(out, segmentLayout.verticesOffset, VERTEX_DTYPE, numVertices)
+    vertices['position'] = segment.positions
+    vertices['color'] = segment.colors
+
+def write_segments_data(out, layout, model):
+    headers = _get_records(out, layout.segmentsOffset, SEGMENT_DTYPE, layout.numSegments)
+    for i in range(0, layout.numSegments):
+        segmentLayout = layout.segments[i]
+        header = headers[i]
+        header['numVertices'] = np.int64(segmentLayout.numVertices) & 0xFFFF
+        header['numTriangles'] = np.int64(segmentLayout.numTriangles) & 0xFFFF
+        header['numBatches'] = np.int64(segmentLayout.numBatches) & 0xFFFF
+        header['bitfieldOffset'] = np.int64(i * layout.numBytesPerBitfield) & 0xFFFF
+        header['numBatchesByte'] = np.int64(segmentLayout.numBatches) & 0xFF # ???
+        header['batchesOffset'] = segmentLayout.batchesOffset
+        header['trianglesOffset'] = segmentLayout.trianglesOffset
+        header['verticesOffset'] = segmentLayout.verticesOffset
+        header['collisionOffset'] = segmentLayout.collisionOffset
+        write_segment_data(out, segmentLayout, model.segments[i], model.textures)
+
+def write_bounding_boxes_data(out, layout, model):
+    bboxes = _get_records(out, layout.bboxesOffset, BOUNDING_BOX_DTYPE, layout.numSegments)
+    values = _as_array([bbox[0] + bbox[1] for bbox in [seg.get_bounding_box() for seg in model.segments]], 6)
+    bboxes['min'] = values[:, 0:3]
+    bboxes['max'] = values[:, 3:6]
+
+def write_bsp_tree_data(out, layout, model):
+    nodes = _get_records(out, layout.bspTreeOffset, BSP_TREE_NODE_DTYPE, layout.bspTreeSize // SIZE_OF_BSP_TREE_NODE)
+    if not layout.hasBspTree:
+        # Write a single blank node.
+        nodes[0] = (-1, -1, SPLIT_AXIS_VALUES['X'], 0, 0)
         return
-    offset = index * SIZE_OF_BSP_TREE_NODE
-    write_bsp_tree_node_data(data, offset, node.leftIndex, node.rightIndex, node.splitAxis, node.segmentNumber, node.splitValue)
-    write_bsp_tree_node(data, node.leftIndex, node.left)
-    write_bsp_tree_node(data, node.rightIndex, node.right)
-
-def write_bitfield(data, offset, numBytes, val):
-    for i in range(0, numBytes):
-        b = (val >> (8 * (numBytes - i - 1))) & 0xFF
-        write8(data, offset + i, b)
-
-def get_texture_nodes_data(model):
-    numTextures = len(model.textures)
-
-    out = [0] * (numTextures * SIZE_OF_TEXTURE_NODE)
-
-    for i in range(0, numTextures):
-        write_texture(out, i * SIZE_OF_TEXTURE_NODE, model.textures[i])
-
-    return out
-
-def get_segments_data(model, startOffset):
-    numSegments = len(model.segments)
-
-    # Calculate total size of data
-    totalSize = 0
-    segmentsSize = 0
-    verticesSize = 0
-    trianglesSize = 0
-    batchesSize = 0
-    for i in range(0, numSegments):
-        segmentsSize += SIZE_OF_SEGMENT
-        verticesSize += align8(len(model.segments[i].vertices) * SIZE_OF_VERTEX)
-        trianglesSize += (len(model.segments[i].triangles) * SIZE_OF_TRIANGLE)
-        batchesSize += align8((len(model.segments[i].batches) + 1) * SIZE_OF_BATCH_INFO)
-    segmentsSize = align16(segmentsSize) + (startOffset % 16)
-    totalSize = segmentsSize + verticesSize + trianglesSize + batchesSize
-
-    numBytesPerBitfield = math.ceil(numSegments / 8)
-
-    out = [0] * totalSize
-
-    segmentDataOffset = segmentsSize
-    for i in range(0, numSegments):
-        segmentOffset = i * SIZE_OF_SEGMENT
-
-        numVertices = len(model.segments[i].vertices)
-        numTriangles = len(model.segments[i].triangles)
-        numBatches = len(model.segments[i].batches)
-
-        write16(out, segmentOffset + 0x1C, numVertices) # Write number of vertices
-        write16(out, segmentOffset + 0x1E, numTriangles) # Write number of triangles
-        write16(out, segmentOffset + 0x20, numBatches) # Write number of batches
-        write16(out, segmentOffset + 0x28, i * numBytesPerBitfield) # Write bitfield offset
-        write8(out, segmentOffset + 0x40, numBatches) # ???
-
-        # Write segment batches
-        write32(out, segmentOffset + 0x0C, startOffset + segmentDataOffset) # Write offset to batches
-        for j in range(0, numBatches):
-            write_batch(out, segmentDataOffset + (j * SIZE_OF_BATCH_INFO), model.segments[i].batches[j])
-        write8(out, segmentDataOffset + (numBatches * SIZE_OF_BATCH_INFO), -1) # Write info for the last batch.
-        write16(out, segmentDataOffset + (numBatches * SIZE_OF_BATCH_INFO) + 2, numVertices)
-        write16(out, segmentDataOffset + (numBatches * SIZE_OF_BATCH_INFO) + 4, numTriangles)
-        segmentDataOffset += align8((len(model.segments[i].batches) + 1) * SIZE_OF_BATCH_INFO)
-    
-        # Write segment triangles
-        write32(out, segmentOffset + 0x04, startOffset + segmentDataOffset) # Write offset to triangles
-        for j in range(0, numTriangles):
-            texIndex = model.segments[i].get_texture_index_from_triangle_index(j)
-            tex = None
-            if texIndex != -1:
-                tex = model.textures[texIndex]
-            write_triangle(out, segmentDataOffset + (j * SIZE_OF_TRIANGLE), model.segments[i].triangles[j], tex)
-        segmentDataOffset += (len(model.segments[i].triangles) * SIZE_OF_TRIANGLE)
-
-        # Write segment vertices
-        write32(out, segmentOffset + 0x00, startOffset + segmentDataOffset) # Write offset to vertices
-        for j in range(0, numVertices):
-            write_vertex(out, segmentDataOffset + (j * SIZE_OF_VERTEX), model.segments[i].vertices[j])
-        segmentDataOffset += align8(len(model.segments[i].vertices) * SIZE_OF_VERTEX)
-
-    return out
-
-def get_bounding_boxes_data(model):
-    numSegments = len(model.segments)
-    out = [0] * (numSegments * SIZE_OF_BOUNDING_BOX)
-
-    for i in range(0, numSegments):
-        write_bounding_box(out, i * SIZE_OF_BOUNDING_BOX, model.segments[i].get_bounding_box())
-
-    return out
-
-def get_collision_data(model, startOffset, segmentsData):
-    numSegments = len(model.segments)
-    out = []
-
-    curOffset = startOffset
-    for segIndex in range(0, numSegments):
-        seg = model.segments[segIndex]
-        numTriangles = len(seg.triangles)
-        collisionOut = [0] * (numTriangles * SIZE_OF_COLLISION_NODE)
-        for i in range(0, numTriangles):
-            tri0, tri1, tri2 = seg.get_collision_data_for_triangle(i)
-            write_collision_data(collisionOut, i * SIZE_OF_COLLISION_NODE, i, tri0, tri1, tri2)
-        write32(segmentsData, (segIndex * SIZE_OF_SEGMENT) + 0x14, curOffset)
-        curOffset += len(collisionOut)
-        out += collisionOut
+    bspTree = model.bspTree
+    numNodes = bspTree.get_num_nodes()
+    if numNodes > len(nodes):
+        raise SystemExit('Error: The BSP tree has ' + str(numNodes) + ' nodes, but there is only room for ' + str(len(nodes)) + '.')
+    nodes = nodes[:numNodes]
+    nodes['leftIndex'] = bspTree.leftIndices
+    nodes['rightIndex'] = bspTree.rightIndices
+    nodes['splitAxis'] = bspTree.splitAxes
+    nodes['segmentNumber'] = bspTree.segmentNumbers & 0xFF
+    nodes['splitValue'] = bspTree.splitValues
+
+def write_bitfields_data(out, layout, model):
+    bitfields = out[layout.bitfieldsOffset:layout.bitfieldsOffset + layout.bitfieldsSize]
+    # Write a single blank node.
+    if not layout.hasBspTree:
+        bitfields[0] = 1
+        return
+    numBytes = layout.numBytesPerBitfield
+    mask = (1 << (8 * numBytes)) - 1
+    data = b''.join([(bitfield & mask).to_bytes(numBytes, 'big') for bitfield in model.bspTree.bitfields[:layout.numSegments]])
+    bitfields[0:len(data)] = np.frombuffer(data, dtype=np.uint8)
+
+def write_collision_data(out, layout, model):
+    for i in range(0, layout.numSegments):
+        segmentLayout = layout.segments[i]
+        seg = model.segments[i]
+        numTriangles = segmentLayout.numTriangles
+        neighbours = seg.get_collision_data()
+        nodes = _get_records(out, segmentLayout.collisionOffset, COLLISION_NODE_DTYPE, numTriangles)
+        nodes['triIndex'] = np.arange(numTriangles)
+        nodes['neighbours'] = neighbours
+
+def write_level_header(out, layout):
+    header = _get_records(out, 0, LEVEL_HEADER_DTYPE, 1)[0]
+    header['numTextures'] = np.int64(layout.numTextures) & 0xFFFF
+    header['numSegments'] = np.int64(layout.numSegments) & 0xFFFF
+    # Level boundaries?
+    header['boundaryX'] = 0x80007FFF
+    header['boundaryY'] = 0x80007FFF
+    header['boundaryZ'] = 0x80007FFF
+    header['texturesOffset'] = layout.texturesOffset
+    header['segmentsOffset'] = layout.segmentsOffset
+    header['bboxesOffset'] = layout.bboxesOffset
+    header['bspTreeOffset'] = layout.bspTreeOffset
+    header['bitfieldsOffset'] = layout.bitfieldsOffset
+    header['collisionOffset'] = layout.collisionOffset
+    header['fileSize'] = layout.fileSize
+
+# Returns the whole level binary as an array of bytes.
+def get_level_binary_data(model, layout=None):
+    if layout == None:
+        layout = LevelBinaryLayout.from_model(model)
+    out = np.zeros(layout.fileSize, dtype=np.uint8)
+    write_level_header(out, layout)
+    write_texture_nodes_data(out, layout, model)
+    write_segments_data(out, layout, model)
+    write_bounding_boxes_data(out, layout, model)
+    write_bsp_tree_data(out, layout, model)
+    write_bitfields_data(out, layout, model)
+    write_collision_data(out, layout, model)
     return out
 
-def get_bsp_tree_data(model):
-    numSegments = len(model.segments)
-    if numSegments == 1 or model.bspTree.rootNode == None:
-        # Write a single blank node.
-        out = [0] * SIZE_OF_BSP_TREE_NODE
-        write_bsp_tree_node_data(out, 0, -1, -1, 'X', 0, 0)
+def write_level_binary_file(path, data, compressionLevel):
+    if is_compressed_level_binary_path(path):
+        write_compressed_file(path, data, compressionLevel)
     else:
-        out = [0] * align16((numSegments - 1) * SIZE_OF_BSP_TREE_NODE)
-        write_bsp_tree_node(out, 0, model.bspTree.rootNode)
-    return out
-
-def get_bitfields_data(model):
-    numSegments = len(model.segments)
-
-    # Write a single blank node.
-    if numSegments == 1 or model.bspTree.rootNode == None:
-        out = [0] * 16
-        out[0] = 1
-        return out
-
-    numBytesPerSegment = math.ceil(numSegments / 8)
-    out = [0] * (numBytesPerSegment * numSegments)
-
-    offset = 0
-    for bitfield in model.bspTree.bitfields:
-        write_bitfield(out, offset, numBytesPerSegment, bitfield)
-        offset += numBytesPerSegment
-
-    return out
+        open(path, 'wb').write(data)
 
 def export_dkr_level_binary(model, args):
-    out = [0] * SIZE_OF_LEVEL_HEADER
-
-    # Number of Textures
-    write16(out, 0x18, len(model.textures)) 
-    # Number of Segments
-    write16(out, 0x1A, len(model.segments))
-
-    # Level boundaries?
-    write32(out, 0x3C, 0x80007FFF)
-    write32(out, 0x40, 0x80007FFF)
-    write32(out, 0x44, 0x80007FFF)
-
-    # Textures
-    offset = len(out)
-    write32(out, 0x00, offset)
-    texturesData = get_texture_nodes_data(model)
-
-    # Segments
-    offset += len(texturesData)
-    write32(out, 0x04, offset)
-    segmentsData = get_segments_data(model, offset)
-
-    # Bounding Boxes
-    offset += len(segmentsData)
-    write32(out, 0x08, offset)
-    bbData = get_bounding_boxes_data(model)
-
-    # BSP Tree
-    offset += len(bbData)
-    write32(out, 0x14, offset)
-    bspData = get_bsp_tree_data(model)
-
-    # Segment bitfields
-    offset += len(bspData)
-    write32(out, 0x10, offset)
-    bfData = get_bitfields_data(model)
-
-    # Collision Data
-    offset +=len(bfData)
-    write32(out, 0x0C, offset)
-    colData = get_collision_data(model, offset, segmentsData)
-
-    out += texturesData
-    out += segmentsData
-    out += bbData
-    out += bspData
-    out += bfData
-    out += colData
-
-    # Write size of file
-    write32(out, 0x48, len(out))
-
-    open(args.output, 'wb').write(bytearray(out))
+    write_level_binary_file(args.output, get_level_binary_data(model), args.compressionlevel)
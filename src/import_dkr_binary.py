@@ -1,117 +1,224 @@
 from model import *
+from model_columnar import *
 from util import *
+from dkr_level_binary_format import *
+from dkr_compression import is_compressed_level_binary_path, read_compressed_file
 import math
+import mmap
+import numpy as np
 from PIL import Image, ImageOps
 from segment_bitfield_generator import calculate_segment_bitfields
 
-def get_uv(data, offset):
-    u = get_s16(data, offset)
-    v = get_s16(data, offset + 2)
-    return UV(u, v)
+# A tree that splits the level into numSegments segments has numSegments - 1 nodes, which is what the writer puts in.
+def parse_bsp_tree(bspTree, data, header):
+    bspTreeOffset = int(header['bspTreeOffset'])
+    numNodes = max(int(header['numSegments']) - 1, 0)
+    if bspTreeOffset < 0 or bspTreeOffset + (numNodes * SIZE_OF_BSP_TREE_NODE) > len(data):
+        raise SystemExit('Error: The BSP tree goes past the end of the level binary.')
+    nodes = read_records(data, BSP_TREE_NODE_DTYPE, bspTreeOffset, numNodes)
+    bspTree.set_nodes(nodes['splitAxis'], nodes['splitValue'], nodes['segmentNumber'], nodes['leftIndex'], nodes['rightIndex'])
 
-splitAxises = ['X', 'Y', 'Z']
-def parse_bsp_tree(data, startOffset, i):
-    offset = startOffset + (i * SIZE_OF_BSP_TREE_NODE)
-    leftIndex = get_s16(data, offset)
-    rightIndex = get_s16(data, offset + 2)
-    splitAxis = splitAxises[get_u8(data, offset + 4)]
-    segment = get_u8(data, offset + 5)
-    splitValue = get_s16(data, offset + 6)
 
-    left = None
-    if(leftIndex != -1):
-        left = parse_bsp_tree(data, startOffset, leftIndex)
-    right = None
-    if(rightIndex != -1):
-        right = parse_bsp_tree(data, startOffset, rightIndex)
+def load_texture(textureNode):
+    decompPath = get_decomp_path()
+    if decompPath != None:
+        vanillaTexImgPath, vanillaTexProperties = get_vanilla_texture_image_path(decompPath, int(textureNode['originalTexIndex']))
+        tex = Image.open(vanillaTexImgPath).convert('RGBA')
+        if vanillaTexProperties["flipped-image"]:
+            tex = ImageOps.flip(tex)
+        return tex
+    return generate_temporary_texture(int(textureNode['width']), int(textureNode['height']), int(textureNode['format']) & 0x7F)
 
-    return BspTreeNode(splitAxis, splitValue, segment, leftIndex, left, rightIndex, right)
+def get_texture_node_values(textureNode):
+    return (int(textureNode['width']), int(textureNode['height']), int(textureNode['format']), int(textureNode['collisionType']), int(textureNode['originalTexIndex']))
 
+def read_segment_vertices(data, segmentHeader):
+    return read_records(data, VERTEX_DTYPE, int(segmentHeader['verticesOffset']), int(segmentHeader['numVertices']))
+
+def read_segment_triangles(data, segmentHeader):
+    return read_records(data, TRIANGLE_DTYPE, int(segmentHeader['trianglesOffset']), int(segmentHeader['numTriangles']))
+
+# The batch list has an extra entry at the end, which marks where the last batch stops.
+def read_segment_batches(data, segmentHeader):
+    return read_records(data, BATCH_DTYPE, int(segmentHeader['batchesOffset']), int(segmentHeader['numBatches']) + 1)
+
+def read_segment_records(data, segmentHeader):
+    return (read_segment_vertices(data, segmentHeader), read_segment_triangles(data, segmentHeader), read_segment_batches(data, segmentHeader))
+
+# Returns the UV coordinates of every triangle, divided by the size of the texture used by its batch.
+# Triangles in batches without a texture keep their raw values, and are marked as not parsed.
+def parse_segment_uvs(triangles, batches, textures):
+    numTriangles = len(triangles)
+    texWidths = np.zeros(numTriangles)
+    texHeights = np.zeros(numTriangles)
+    parsed = np.zeros(numTriangles, dtype=bool)
+    for j in range(0, len(batches) - 1):
+        texIndex = int(batches[j]['texIndex'])
+        if texIndex == -1:
+            continue
+        batchTriIndex = int(batches[j]['triOffset'])
+        batchNumTris = int(batches[j + 1]['triOffset']) - batchTriIndex
+        if batchNumTris <= 0:
+            continue
+        texWidths[batchTriIndex:batchTriIndex + batchNumTris] = textures[texIndex].width
+        texHeights[batchTriIndex:batchTriIndex + batchNumTris] = textures[texIndex].height
+        parsed[batchTriIndex:batchTriIndex + batchNumTris] = True
+    uvs = triangles['uvs'].astype(np.float64)
+    texSizes = np.stack((texWidths, texHeights), axis=-1)[:, None, :] * 32.0
+    scaled = np.divide(uvs, texSizes, out=np.zeros_like(uvs), where=(texSizes != 0))
+    uvs[parsed] = scaled[parsed]
+    return (uvs, parsed)
+
+def set_vertex_columns(segment, vertices):
+    segment.set_vertex_columns(vertices['position'], vertices['color'])
+
+def set_triangle_columns(segment, triangles, batches, textures):
+    uvs, parsed = parse_segment_uvs(triangles, batches, textures)
+    segment.set_triangle_columns(triangles['flags'], triangles['indices'], uvs, parsed)
+
+def set_batch_columns(segment, batches):
+    vertOffsets = batches['vertOffset'].astype(np.int64)
+    triOffsets = batches['triOffset'].astype(np.int64)
+    segment.set_batch_columns(batches['texIndex'][:-1], batches['flags'][:-1],
+        vertOffsets[:-1], np.diff(vertOffsets), triOffsets[:-1], np.diff(triOffsets))
+
+def parse_segment(data, segmentHeader, textures):
+    segment = ColumnarModel3DSegment()
+    vertices, triangles, batches = read_segment_records(data, segmentHeader)
+    set_vertex_columns(segment, vertices)
+    set_triangle_columns(segment, triangles, batches, textures)
+    set_batch_columns(segment, batches)
+    return segment
+
+def parse_bitfields(data, bitfieldsOffset, numSegments):
+    numBytesForBitfield = math.ceil(numSegments / 8)
+    bitfields = []
+    for i in range(0, numSegments):
+        offset = bitfieldsOffset + (i * numBytesForBitfield)
+        bitfields.append(int.from_bytes(data[offset:offset + numBytesForBitfield], 'big'))
+    return bitfields
+
+def read_level_binary_file(path):
+    if is_compressed_level_binary_path(path):
+        return read_compressed_file(path)
+    return open(path, 'rb').read()
 
 def import_dkr_level_binary(args):
-    data = list(open(args.input, 'rb').read())
+    data = memoryview(read_level_binary_file(args.input))
     model = Model3D()
 
-    texturesOffset  = get_u32(data, 0x00)
-    segmentsOffset  = get_u32(data, 0x04)
+    header = read_records(data, LEVEL_HEADER_DTYPE, 0, 1)[0]
     # Don't need to get bounding boxes, since those are easy to calculate.
     # Don't need to get collision data either, I think.
-    bitfieldsOffset = get_u32(data, 0x10)
-    bspTreeOffset   = get_u32(data, 0x14)
-
-    numTextures = get_u16(data, 0x18)
-    numSegments = get_u16(data, 0x1A)
-
-    for i in range(0, numTextures):
-        texOffset = texturesOffset + (i * SIZE_OF_TEXTURE_NODE)
-        originalTexIndex = get_u32(data, texOffset + 0)
-        width = get_u8(data, texOffset + 4)
-        height = get_u8(data, texOffset + 5)
-        format = get_u8(data, texOffset + 6)
-        collisionType = get_u8(data, texOffset + 7)
-        decompPath = get_decomp_path()
-        if decompPath != None:
-            vanillaTexImgPath, vanillaTexProperties = get_vanilla_texture_image_path(decompPath, originalTexIndex)
-            tex = Image.open(vanillaTexImgPath).convert('RGBA')
-            if vanillaTexProperties["flipped-image"]:
-                tex = ImageOps.flip(tex)
-        else:
-            tex = generate_temporary_texture(width, height, format & 0x7F)
-        model.textures.append(TextureNode(tex, width, height, format, collisionType, originalTexIndex))
-    for i in range(0, numSegments):
-        segment = Model3DSegment()
-        segOffset = segmentsOffset + (i * SIZE_OF_SEGMENT)
-        numVertices  = get_u16(data, segOffset + 0x1C)
-        numTriangles = get_u16(data, segOffset + 0x1E)
-        numBatches   = get_u16(data, segOffset + 0x20)
-        verticesOffset = get_u32(data, segOffset + 0x00)
-        trianglesOffset = get_u32(data, segOffset + 0x04)
-        batchesOffset = get_u32(data, segOffset + 0x0C)
-        for j in range(0, numVertices):
-            vertDataOffset = verticesOffset + (j * SIZE_OF_VERTEX)
-            x = get_s16(data, vertDataOffset + 0x00)
-            y = get_s16(data, vertDataOffset + 0x02)
-            z = get_s16(data, vertDataOffset + 0x04)
-            r = get_u8(data, vertDataOffset + 0x06)
-            g = get_u8(data, vertDataOffset + 0x07)
-            b = get_u8(data, vertDataOffset + 0x08)
-            a = get_u8(data, vertDataOffset + 0x09)
-            segment.vertices.append(Vertex(x, y, z, r, g, b, a))
-        for j in range(0, numTriangles):
-            triDataOffset = trianglesOffset + (j * SIZE_OF_TRIANGLE)
-            flags = get_u8(data, triDataOffset + 0x00)
-            vi0   = get_u8(data, triDataOffset + 0x01)
-            vi1   = get_u8(data, triDataOffset + 0x02)
-            vi2   = get_u8(data, triDataOffset + 0x03)
-            uv0   = get_uv(data, triDataOffset + 0x04)
-            uv1   = get_uv(data, triDataOffset + 0x08)
-            uv2   = get_uv(data, triDataOffset + 0x0C)
-            segment.triangles.append(Triangle(flags, vi0, vi1, vi2, uv0, uv1, uv2))
-        for j in range(0, numBatches):
-            batDataOffset = batchesOffset + (j * SIZE_OF_BATCH_INFO)
-            texIndex       = get_s8(data, batDataOffset + 0x00)
-            batchVertIndex = get_u16(data, batDataOffset + 0x02)
-            batchNumVerts  = get_u16(data, batDataOffset + SIZE_OF_BATCH_INFO + 0x02) - batchVertIndex
-            batchTriIndex  = get_u16(data, batDataOffset + 0x04)
-            batchNumTris   = get_u16(data, batDataOffset + SIZE_OF_BATCH_INFO + 0x04) - batchTriIndex
-            batchFlags     = get_u32(data, batDataOffset + 0x08)
-            #print("This batch: Tex Index = " + str(texIndex) + ", Num Verts = " + str(batchNumVerts) + ", Num Tris = " + str(batchNumTris))
-            if texIndex == -1:
-                model.hasTrianglesWithoutATexture = True
-            else:
-                for k in range(0, batchNumTris):
-                    texWidth = model.textures[texIndex].width
-                    texHeight = model.textures[texIndex].height
-                    segment.triangles[batchTriIndex + k].uv0.parse_uv(texWidth, texHeight)
-                    segment.triangles[batchTriIndex + k].uv1.parse_uv(texWidth, texHeight)
-                    segment.triangles[batchTriIndex + k].uv2.parse_uv(texWidth, texHeight)
-            segment.batches.append(Model3DBatch(texIndex, batchFlags, batchVertIndex, batchNumVerts, batchTriIndex, batchNumTris))
+    bitfieldsOffset = int(header['bitfieldsOffset'])
+    numSegments = int(header['numSegments'])
+
+    textureNodes = read_records(data, TEXTURE_NODE_DTYPE, int(header['texturesOffset']), int(header['numTextures']))
+    for textureNode in textureNodes:
+        model.textures.append(TextureNode(load_texture(textureNode), *get_texture_node_values(textureNode)))
+    segmentHeaders = read_records(data, SEGMENT_DTYPE, int(header['segmentsOffset']), numSegments)
+    for segmentHeader in segmentHeaders:
+        segment = parse_segment(data, segmentHeader, model.textures)
+        if (segment.batchTexIndices == -1).any():
+            model.hasTrianglesWithoutATexture = True
         model.segments.append(segment)
     if numSegments > 1:
-        #numBytesForBitfield = math.ceil(numSegments / 8)
-        #for i in range(0, numSegments):
-        #    model.bspTree.bitfields.append(get_bitfield(data, bitfieldsOffset + (i * numBytesForBitfield), numBytesForBitfield))
-        if args.output != None: # Ignoring for preview, since calculating bitfields is slow.
+        if args.output != None and not args.analyze and not args.dryrun:
             calculate_segment_bitfields(model)
-        model.bspTree.rootNode = parse_bsp_tree(data, bspTreeOffset, 0)
+        else: # Calculating bitfields is slow, so the ones in the file are used for preview.
+            model.bspTree.bitfields = parse_bitfields(data, bitfieldsOffset, numSegments)
+        parse_bsp_tree(model.bspTree, data, header)
     return model
+
+# Given to TextureNode.__init__() instead of an image, so that the image gets loaded when it is first used.
+_TEX_NOT_LOADED = object()
+
+class LazyTextureNode(TextureNode):
+    def __init__(self, textureNode):
+        self._textureNode = textureNode
+        super().__init__(_TEX_NOT_LOADED, *get_texture_node_values(textureNode))
+
+    @property
+    def tex(self):
+        if not self._texLoaded:
+            self.tex = load_texture(self._textureNode)
+        return self._tex
+
+    @tex.setter
+    def tex(self, tex):
+        self._texLoaded = tex is not _TEX_NOT_LOADED
+        self._tex = tex if self._texLoaded else None
+
+# The columns of each group (vertices, triangles or batches) are decoded the first time they are used.
+class LazyModel3DSegment(ColumnarModel3DSegment):
+    def __init__(self, data, segmentHeader, textures, bbox):
+        super().__init__()
+        self._data = data
+        self._header = segmentHeader
+        self._textures = textures
+        self._unloadedColumns = set([COLUMNS_VERTICES, COLUMNS_TRIANGLES, COLUMNS_BATCHES])
+        if segmentHeader['numVertices'] > 0:
+            self.set_bounding_box(bbox)
+
+    # Only the records of that group are read, except that triangles need the batches for the sizes of their textures.
+    def _decode_columns(self, group):
+        if group == COLUMNS_VERTICES:
+            set_vertex_columns(self, read_segment_vertices(self._data, self._header))
+        elif group == COLUMNS_TRIANGLES:
+            set_triangle_columns(self, read_segment_triangles(self._data, self._header), read_segment_batches(self._data, self._header), self._textures)
+        else:
+            set_batch_columns(self, read_segment_batches(self._data, self._header))
+
+    def get_counts(self):
+        header = self._header
+        counts = [int(header['numVertices']), int(header['numTriangles']), int(header['numBatches'])]
+        loadedCounts = super().get_counts()
+        for i, group in enumerate([COLUMNS_VERTICES, COLUMNS_TRIANGLES, COLUMNS_BATCHES]):
+            if group not in self._unloadedColumns:
+                counts[i] = loadedCounts[i]
+        return tuple(counts)
+
+# A level binary that is only decoded as it gets used. Headers, the BSP tree and the bitfields are read
+# straight away, but the geometry of a segment isn't decoded until it is first accessed, and the pixels
+# of a texture aren't loaded until they are first requested.
+# The model owns `data`, and close() (or leaving a `with` block) closes it if it is a mmap. Segments that
+# haven't been decoded by then can't be used after that.
+class LazyModel3D(Model3D):
+    def __init__(self, data):
+        super().__init__()
+        self.data = data
+        header = read_records(data, LEVEL_HEADER_DTYPE, 0, 1)[0]
+        numSegments = int(header['numSegments'])
+        # The headers are copied, so that nothing but `data` points into the file and it can be closed.
+        textureNodes = read_records(data, TEXTURE_NODE_DTYPE, int(header['texturesOffset']), int(header['numTextures'])).copy()
+        for textureNode in textureNodes:
+            self.textures.append(LazyTextureNode(textureNode))
+        segmentHeaders = read_records(data, SEGMENT_DTYPE, int(header['segmentsOffset']), numSegments).copy()
+        bboxes = read_records(data, BOUNDING_BOX_DTYPE, int(header['bboxesOffset']), numSegments)
+        for segmentHeader, bbox in zip(segmentHeaders, bboxes):
+            batches = read_segment_batches(data, segmentHeader)
+            if (batches['texIndex'][:-1] == -1).any():
+                self.hasTrianglesWithoutATexture = True
+            self.segments.append(LazyModel3DSegment(data, segmentHeader, self.textures, (bbox['min'].tolist(), bbox['max'].tolist())))
+        if numSegments > 1:
+            self.bspTree.bitfields = parse_bitfields(data, int(header['bitfieldsOffset']), numSegments)
+            parse_bsp_tree(self.bspTree, data, header)
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+# Opens a level binary without decoding it; see LazyModel3D. The caller should close the model when it is done.
+# Compressed files can't be mapped, so those get decompressed into memory instead.
+def open_dkr_level_binary(path):
+    if is_compressed_level_binary_path(path):
+        return LazyModel3D(read_compressed_file(path))
+    with open(path, 'rb') as binaryFile:
+        data = mmap.mmap(binaryFile.fileno(), 0, access=mmap.ACCESS_READ)
+    return LazyModel3D(data)
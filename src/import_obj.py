@@ -1,5 +1,7 @@
 import os.path
 from model import *
+from model_textures import get_texture_key
+import numpy as np
 from PIL import Image, ImageOps
 from model_split import auto_split_model, manually_split_model
 
@@ -13,12 +15,23 @@ def split_obj_line(line):
         return []
     return line.split(' ')
 
-def load_and_add_texture(model, imgPath, originalTexIndex, flipTexture = False):
+# Returns the index of the texture. Materials often use the same image, so each image is only loaded once, and
+# images with the same pixels share a texture.
+def load_and_add_texture(model, imgPath, originalTexIndex, flipTexture, pathToTexIndex, keyToTexIndex):
+    pathKey = (os.path.realpath(imgPath), originalTexIndex, flipTexture)
+    if pathKey in pathToTexIndex:
+        return pathToTexIndex[pathKey]
     tex = Image.open(imgPath).convert('RGBA')
     if flipTexture:
         tex = ImageOps.flip(tex)
     width, height = tex.size
-    model.textures.append(TextureNode(tex, width, height, TEX_FORMAT_RGBA16, 0, originalTexIndex))
+    texture = TextureNode(tex, width, height, TEX_FORMAT_RGBA16, 0, originalTexIndex)
+    key = get_texture_key(texture)
+    if key not in keyToTexIndex:
+        keyToTexIndex[key] = len(model.textures)
+        model.textures.append(texture)
+    pathToTexIndex[pathKey] = keyToTexIndex[key]
+    return pathToTexIndex[pathKey]
 
 def load_materials(basePath, matPath, model, matToTexIndex):
     matPath = basePath + '/' + matPath
@@ -26,7 +39,8 @@ def load_materials(basePath, matPath, model, matToTexIndex):
         raise SystemExit('Error: Material file "' + matPath + '" does not exist!')
 
     originalTexIndex = -1
-    numTextures = 0
+    pathToTexIndex = {}
+    keyToTexIndex = {}
     curIndex = -1
     curMatName = ''
     curMatPath = ''
@@ -42,9 +56,7 @@ def load_materials(basePath, matPath, model, matToTexIndex):
                     if not curMatHasTexture:
                         matToTexIndex[curMatName] = -1
                     else:
-                        matToTexIndex[curMatName] = numTextures
-                        numTextures += 1
-                        load_and_add_texture(model, curMatPath, originalTexIndex, shouldFlipTexture)
+                        matToTexIndex[curMatName] = load_and_add_texture(model, curMatPath, originalTexIndex, shouldFlipTexture, pathToTexIndex, keyToTexIndex)
                 curMatName = parts[1]
                 curIndex += 1
                 curMatHasTexture = False
@@ -67,13 +79,21 @@ def load_materials(basePath, matPath, model, matToTexIndex):
     if not curMatHasTexture:
         matToTexIndex[curMatName] = -1
     else:
-        matToTexIndex[curMatName] = numTextures
-        numTextures += 1
-        load_and_add_texture(model, curMatPath, originalTexIndex)
+        matToTexIndex[curMatName] = load_and_add_texture(model, curMatPath, originalTexIndex, False, pathToTexIndex, keyToTexIndex)
 
 DEFAULT_BATCH_FLAGS = 0x10
 DEFAULT_TRIANGLE_FLAGS = 0x00
 
+# The triangles are added once the whole file has been read, so each segment only needs a single add_triangles() call.
+# Each face is [texIndex, vertIndex0, vertIndex1, vertIndex2, uvIndex0, uvIndex1, uvIndex2]
+def add_faces_to_segments(model, segmentFaces, vertices, uvs):
+    positions = np.array([(v.x, v.y, v.z) for v in vertices], dtype=np.int64).reshape(-1, 3)
+    colors = np.array([(v.color.r, v.color.g, v.color.b, v.color.a) for v in vertices], dtype=np.int64).reshape(-1, 4)
+    uvValues = np.array([(uv.u, uv.v) for uv in uvs], dtype=np.float64).reshape(-1, 2)
+    for segmentIndex in segmentFaces:
+        faces = np.array(segmentFaces[segmentIndex], dtype=np.int64)
+        model.segments[segmentIndex].add_triangles(faces[:, 0], DEFAULT_BATCH_FLAGS, DEFAULT_TRIANGLE_FLAGS, positions, colors, faces[:, 1:4], uvValues[faces[:, 4:7]], vertices=vertices)
+
 def import_obj_model(args):
     model = Model3D()
 
@@ -93,6 +113,7 @@ def import_obj_model(args):
 
     vertices = []
     uvs = []
+    segmentFaces = {}
     bspNodes = None
 
     for line in objText:
@@ -137,17 +158,10 @@ def import_obj_model(args):
                     uvIndex = int(subParts[1]) - 1
                     vertexIndices.append(vertIndex)
                     uvIndices.append(uvIndex)
-                vert0 = vertices[vertexIndices[0]]
-                vert1 = vertices[vertexIndices[1]]
-                vert2 = vertices[vertexIndices[2]]
-                uv0 = uvs[uvIndices[0]]
-                uv1 = uvs[uvIndices[1]]
-                uv2 = uvs[uvIndices[2]]
-                model.segments[currentSegment].add_triangle(curTextureIndex, DEFAULT_BATCH_FLAGS, DEFAULT_TRIANGLE_FLAGS, vert0, vert1, vert2, uv0, uv1, uv2)
+                faces = segmentFaces.setdefault(currentSegment, [])
+                faces.append([curTextureIndex] + vertexIndices[0:3] + uvIndices[0:3])
                 if isQuad:
-                    vert3 = vertices[vertexIndices[3]]
-                    uv3 = uvs[uvIndices[3]]
-                    model.segments[currentSegment].add_triangle(curTextureIndex, DEFAULT_BATCH_FLAGS, DEFAULT_TRIANGLE_FLAGS, vert0, vert2, vert3, uv0, uv2, uv3)
+                    faces.append([curTextureIndex, vertexIndices[0], vertexIndices[2], vertexIndices[3], uvIndices[0], uvIndices[2], uvIndices[3]])
                 #except:
                 #    print("Warning: Failed to load a triangle. Obj file might be corrupted!")
             elif objCmd == 'mtllib':
@@ -189,14 +203,10 @@ def import_obj_model(args):
                     raise SystemExit('Error: Invalid Axis "' + parts[3] + '". Should either be X, Y, or Z')
                 segment = int(parts[4])
                 splitValue = int(parts[5])
-                bspNodes.append(BspTreeNode(splitAxis, splitValue, segment, leftIndex, None, rightIndex, None))
+                bspNodes.append((SPLIT_AXISES.index(splitAxis), splitValue, segment, leftIndex, rightIndex))
             elif objCmd == 'bsp_tree_end':
-                for i in range(0, len(bspNodes)):
-                    if bspNodes[i].leftIndex != -1:
-                        bspNodes[i].left = bspNodes[bspNodes[i].leftIndex]
-                    if bspNodes[i].rightIndex != -1:
-                        bspNodes[i].right = bspNodes[bspNodes[i].rightIndex]
-                model.bspTree.rootNode = bspNodes[0]
+                # The nodes are listed in the same order as the level binary.
+                model.bspTree.set_nodes(*np.array(bspNodes, dtype=np.int64).reshape(-1, 5).T)
                 bspNodes = None
             elif objCmd == 'segment_mask':
                 model.bspTree.bitfields.append(int(parts[1], 0))
@@ -207,8 +217,14 @@ def import_obj_model(args):
             # Unknown command
             else:
                 print('Unimplemented command: ' + objCmd)
-    if args.autosplit >= 2:
-        return auto_split_model(model, args.autosplit)
+    add_faces_to_segments(model, segmentFaces, vertices, uvs)
+    calculateBitfields = not args.analyze # The budget doesn't depend on the bitfields, and calculating them is slow.
+    if args.dryrun:
+        return model # The split is only estimated.
+    elif args.autosplit >= 2:
+        return auto_split_model(model, args.autosplit, calculateBitfields, jobs=args.jobs, interpolateColors=args.interpolatecolors, splitMode=args.splitmode,
+            saveSplitPath=args.savesplit, assign=args.assign, splitCachePath=args.splitcache)
     elif args.manualsplit != None:
-        return manually_split_model(model, args.manualsplit)
+        return manually_split_model(model, args.manualsplit, calculateBitfields, jobs=args.jobs, interpolateColors=args.interpolatecolors, assign=args.assign,
+            splitCachePath=args.splitcache)
     return model
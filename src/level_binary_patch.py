@@ -0,0 +1,143 @@
+import hashlib
+import struct
+from util import *
+from export_dkr_level_binary import LevelBinaryLayout, get_level_binary_data, write_level_binary_file
+from import_dkr_binary import read_level_binary_file
+
+PATCH_EXTENSION = '.dkrpatch'
+
+# Patch file layout (big-endian):
+#   0x00: "DKRPATCH"
+#   0x08: Size of the base binary (u32), followed by its SHA-1 hash
+#   0x20: Size of the new binary (u32), followed by its SHA-1 hash
+#   0x38: Number of operations (u32)
+#   0x3C: Operations; each one is a type (u8), an offset into the new binary (u32), and a size (u32).
+#         PATCH_OP_DATA is followed by the new bytes, and PATCH_OP_COPY is followed by an offset into the base binary (u32).
+# Any part of the new binary that no operation covers is the same as the base binary at the same offset.
+PATCH_MAGIC = b'DKRPATCH'
+PATCH_HEADER_FORMAT = '>8sI20sI20sI'
+PATCH_OP_FORMAT = '>BII'
+PATCH_COPY_FORMAT = '>I'
+PATCH_OP_DATA = 0
+PATCH_OP_COPY = 1
+
+def _hash(data):
+    return hashlib.sha1(data).digest()
+
+# Splits the binary into the pieces that get compared: each section, and each segment's share of a section.
+def get_patch_chunks(layout):
+    chunks = [(0, layout.texturesOffset), (layout.texturesOffset, layout.texturesSize)]
+    segmentHeadersEnd = layout.segmentsOffset + layout.segmentHeadersSize
+    for i in range(0, layout.numSegments):
+        chunks.append((layout.segmentsOffset + (i * SIZE_OF_SEGMENT), SIZE_OF_SEGMENT))
+    paddingOffset = layout.segmentsOffset + (layout.numSegments * SIZE_OF_SEGMENT)
+    chunks.append((paddingOffset, segmentHeadersEnd - paddingOffset))
+    for segment in layout.segments:
+        chunks.append((segment.batchesOffset, segment.batchesSize))
+        chunks.append((segment.trianglesOffset, segment.trianglesSize))
+        chunks.append((segment.verticesOffset, segment.verticesSize))
+    chunks.append((layout.bboxesOffset, layout.bboxesSize))
+    chunks.append((layout.bspTreeOffset, layout.bspTreeSize))
+    chunks.append((layout.bitfieldsOffset, layout.bitfieldsSize))
+    for segment in layout.segments:
+        chunks.append((segment.collisionOffset, segment.collisionSize))
+    return [chunk for chunk in chunks if chunk[1] > 0]
+
+def _add_op(ops, op):
+    if len(ops) > 0:
+        prevOp = ops[-1]
+        if prevOp[0] == op[0] and prevOp[1] + prevOp[2] == op[1]:
+            if op[0] == PATCH_OP_DATA:
+                ops[-1] = (op[0], prevOp[1], prevOp[2] + op[2], None)
+                return
+            elif prevOp[3] + prevOp[2] == op[3]:
+                ops[-1] = (op[0], prevOp[1], prevOp[2] + op[2], prevOp[3])
+                return
+    ops.append(op)
+
+# Returns a list of (type, offset, size, baseOffset) operations, that turn `baseData` into `newData`.
+# A chunk that isn't at the same offset in the base binary can still be copied from wherever it moved to,
+# so growing one segment doesn't resend the segments after it.
+def get_patch_ops(baseData, newData, layout):
+    baseView = memoryview(baseData).cast('B')
+    newView = memoryview(newData).cast('B')
+    baseChunks = {}
+    baseLayout = LevelBinaryLayout.from_binary(baseView)
+    if baseLayout != None:
+        for offset, size in get_patch_chunks(baseLayout):
+            baseChunks.setdefault(_hash(baseView[offset:offset + size]), offset)
+    ops = []
+    for offset, size in get_patch_chunks(layout):
+        end = offset + size
+        newHash = _hash(newView[offset:end])
+        if end <= len(baseView) and _hash(baseView[offset:end]) == newHash:
+            continue
+        baseOffset = baseChunks.get(newHash)
+        if baseOffset != None:
+            _add_op(ops, (PATCH_OP_COPY, offset, size, baseOffset))
+        else:
+            _add_op(ops, (PATCH_OP_DATA, offset, size, None))
+    return ops
+
+def create_level_patch(baseData, newData, layout):
+    newView = memoryview(newData).cast('B')
+    ops = get_patch_ops(baseData, newView, layout)
+    out = bytearray(struct.pack(PATCH_HEADER_FORMAT, PATCH_MAGIC, len(baseData), _hash(baseData), len(newView), _hash(newView), len(ops)))
+    for opType, offset, size, baseOffset in ops:
+        out += struct.pack(PATCH_OP_FORMAT, opType, offset, size)
+        if opType == PATCH_OP_DATA:
+            out += newView[offset:offset + size]
+        else:
+            out += struct.pack(PATCH_COPY_FORMAT, baseOffset)
+    return (out, ops)
+
+def apply_level_patch(baseData, patchData):
+    headerSize = struct.calcsize(PATCH_HEADER_FORMAT)
+    opHeaderSize = struct.calcsize(PATCH_OP_FORMAT)
+    copyHeaderSize = struct.calcsize(PATCH_COPY_FORMAT)
+    if len(patchData) < headerSize:
+        raise SystemExit('Error: Invalid level binary patch.')
+    magic, baseSize, baseHash, newSize, newHash, numOps = struct.unpack_from(PATCH_HEADER_FORMAT, patchData, 0)
+    if magic != PATCH_MAGIC:
+        raise SystemExit('Error: Invalid level binary patch.')
+    if len(baseData) != baseSize or _hash(baseData) != baseHash:
+        raise SystemExit('Error: The patch was not made from this level binary.')
+    baseView = memoryview(baseData).cast('B')
+    out = bytearray(newSize)
+    out[0:min(baseSize, newSize)] = baseView[0:min(baseSize, newSize)]
+    offset = headerSize
+    try:
+        for i in range(0, numOps):
+            opType, opOffset, opSize = struct.unpack_from(PATCH_OP_FORMAT, patchData, offset)
+            offset += opHeaderSize
+            if opType == PATCH_OP_DATA:
+                source = patchData[offset:offset + opSize]
+                offset += opSize
+            elif opType == PATCH_OP_COPY:
+                baseOffset = struct.unpack_from(PATCH_COPY_FORMAT, patchData, offset)[0]
+                offset += copyHeaderSize
+                source = baseView[baseOffset:baseOffset + opSize]
+            else:
+                raise SystemExit('Error: Invalid level binary patch.')
+            if opOffset + opSize > newSize or len(source) != opSize:
+                raise SystemExit('Error: Invalid level binary patch.')
+            out[opOffset:opOffset + opSize] = source
+    except struct.error:
+        raise SystemExit('Error: Invalid level binary patch.')
+    if _hash(out) != newHash:
+        raise SystemExit('Error: The patched level binary does not match the patch. The patch might be corrupted.')
+    return out
+
+def export_dkr_level_binary_patch(model, args):
+    baseData = read_level_binary_file(args.patchbase)
+    layout = LevelBinaryLayout.from_model(model)
+    newData = get_level_binary_data(model, layout)
+    patch, ops = create_level_patch(baseData, newData, layout)
+    open(args.output, 'wb').write(patch)
+    dataSize = sum([op[2] for op in ops if op[0] == PATCH_OP_DATA])
+    print('Patch is ' + str(len(patch)) + ' bytes, and has ' + str(dataSize) + ' of ' + str(len(newData)) + ' bytes of new data.')
+
+def apply_dkr_level_binary_patch(args):
+    baseData = read_level_binary_file(args.patchbase)
+    newData = apply_level_patch(baseData, open(args.input, 'rb').read())
+    write_level_binary_file(args.output, newData, args.compressionlevel)
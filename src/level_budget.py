@@ -0,0 +1,97 @@
+import json
+from util import *
+from export_dkr_level_binary import LevelBinaryLayout
+
+MAX_U8 = 0xFF
+MAX_U16 = 0xFFFF
+MAX_S8 = 0x7F
+
+# Counts at or above this fraction of a field's limit get a warning.
+LIMIT_WARNING_RATIO = 0.9
+
+def _check_limit(problems, name, value, limit, segmentIndex=None):
+    if value > limit:
+        severity = 'error'
+    elif value >= limit * LIMIT_WARNING_RATIO:
+        severity = 'warning'
+    else:
+        return
+    problem = { 'severity': severity, 'field': name, 'value': value, 'limit': limit }
+    if segmentIndex != None:
+        problem['segment'] = segmentIndex
+    problems.append(problem)
+
+# Returns the counts of a LevelBinaryLayout that are close to or over the limits of the level binary format.
+def get_layout_problems(layout):
+    problems = []
+    _check_limit(problems, 'numTextures', layout.numTextures, MAX_S8 + 1) # Batches store the texture index as a s8.
+    _check_limit(problems, 'numSegments', layout.numSegments, MAX_U8 + 1) # BSP tree nodes store the segment as a u8.
+    for segmentIndex, seg in enumerate(layout.segments):
+        # Segment counts are stored as u16 values, except for the second copy of the batch count, which is a u8.
+        # Batch offsets and collision triangle indices are u16 values too, so they share the same limits.
+        _check_limit(problems, 'numVertices', seg.numVertices, MAX_U16, segmentIndex)
+        _check_limit(problems, 'numTriangles', seg.numTriangles, MAX_U16, segmentIndex)
+        _check_limit(problems, 'numBatches', seg.numBatches, MAX_U8, segmentIndex)
+        _check_limit(problems, 'bitfieldOffset', segmentIndex * layout.numBytesPerBitfield, MAX_U16, segmentIndex)
+    return problems
+
+# Raises an error if any of the problems are counts that are over the limits.
+def check_layout_problems(problems):
+    errors = [problem for problem in problems if problem['severity'] == 'error']
+    if len(errors) > 0:
+        raise SystemExit('Error: ' + str(len(errors)) + ' count(s) are over the limits of the level binary format.')
+
+def _get_segment_budget(layout, segmentIndex):
+    seg = layout.segments[segmentIndex]
+    batchesDataSize = (seg.numBatches + 1) * SIZE_OF_BATCH_INFO # The extra batch marks the end of the list.
+    verticesDataSize = seg.numVertices * SIZE_OF_VERTEX
+    return {
+        'index': segmentIndex,
+        'numVertices': seg.numVertices,
+        'numTriangles': seg.numTriangles,
+        'numBatches': seg.numBatches,
+        'bytes': {
+            'batches': batchesDataSize,
+            'batchesPadding': seg.batchesSize - batchesDataSize,
+            'triangles': seg.trianglesSize,
+            'vertices': verticesDataSize,
+            'verticesPadding': seg.verticesSize - verticesDataSize,
+            'collision': seg.collisionSize,
+        },
+        'totalBytes': seg.batchesSize + seg.trianglesSize + seg.verticesSize + seg.collisionSize,
+    }
+
+# Returns a JSON-friendly report of how many bytes each part of the level binary takes up.
+# `maxSize` is the largest the whole binary is allowed to be, or None for no limit.
+def get_level_budget(model, maxSize=None):
+    layout = LevelBinaryLayout.from_model(model)
+    segments = [_get_segment_budget(layout, i) for i in range(0, layout.numSegments)]
+    report = {
+        'fileSize': layout.fileSize,
+        'sections': {
+            'header': SIZE_OF_LEVEL_HEADER,
+            'textureNodes': layout.texturesSize,
+            'segmentHeaders': layout.segmentHeadersSize,
+            'segmentData': layout.segmentsSize - layout.segmentHeadersSize,
+            'boundingBoxes': layout.bboxesSize,
+            'bspTree': layout.bspTreeSize,
+            'bitfields': layout.bitfieldsSize,
+            'collision': layout.collisionSize,
+        },
+        'segments': segments,
+        'maxSize': maxSize,
+        'overBudget': maxSize != None and layout.fileSize > maxSize,
+        'problems': get_layout_problems(layout),
+    }
+    return report
+
+def analyze_level_budget(model, args):
+    report = get_level_budget(model, args.maxsize)
+    reportText = json.dumps(report, indent=4)
+    if args.output != None:
+        open(args.output, 'w').write(reportText + '\n')
+    else:
+        print(reportText)
+    check_layout_problems(report['problems'])
+    if report['overBudget']:
+        raise SystemExit('Error: The level binary would be ' + str(report['fileSize']) + ' bytes, which is over the budget of ' + str(args.maxsize) + ' bytes.')
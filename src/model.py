@@ -1,5 +1,7 @@
+import numpy as np
 from numpy import array, dot
 from util import *
+from collision_adjacency import get_collision_neighbours
 
 MAX_NUM_VERTS_PER_BATCH = 24
 MAX_NUM_TRIS_PER_BATCH = 16
@@ -194,12 +196,25 @@ class Model3DBatch:
     def __repr__(self):
         return str(self.texIndex) + ":verts{" + str(self.vertOffset) + "," + str(self.numVertices) + "}"
 
+# Vertices are only shared within a batch if both their position and color match.
+def get_vertex_key(vertex):
+    color = vertex.color
+    return (vertex.x, vertex.y, vertex.z, color.r, color.g, color.b, color.a)
+
 class Model3DSegment:
     def __init__(self):
         self.batches = []
         self.vertices = []
         self.triangles = []
         self.bbox = None
+        self.bboxDirty = True
+        self._bboxSignature = None
+        self._batchVertexLookup = {}
+        self._batchVertexLookupRange = None
+        self._triangleLookup = None
+        self._triangleLookupSignature = None
+        self._trianglePositions = None
+        self._collisionData = None
 
     def _new_batch(self, texIndex=-1, batchFlags=0):
         newBatch = Model3DBatch(texIndex, batchFlags)
@@ -209,69 +224,218 @@ class Model3DSegment:
             newBatch.triOffset = prevBatch.triOffset + prevBatch.numTriangles
         self.batches.append(newBatch)
 
-    def _check_batch_for_vertex_index(self, vertex):
+    # Returns (texIndex, flags, vertOffset, numVertices, numTriangles) for the last batch, or None if there are no batches.
+    def _get_last_batch(self):
+        if len(self.batches) == 0:
+            return None
         batch = self.batches[-1]
-        if batch.numVertices == 0:
-            return -1
-
-        for i in range(0, batch.numVertices):
-            if self.vertices[batch.vertOffset + i] == vertex:
-                return i
-
-        return -1
-
-    def _add_vertices_to_batch(self, texIndex, batchFlags, verts):
-        numberOfNewVertices = 3
-        vertIndices = [-1, -1, -1]
-
-        for i in range(0, 3):
-            vertIndices[i] = self._check_batch_for_vertex_index(verts[i])
-            if vertIndices[i] > -1:
-                numberOfNewVertices -= 1
-
-        if self.batches[-1].numVertices + numberOfNewVertices > MAX_NUM_VERTS_PER_BATCH:
+        return (batch.texIndex, batch.flags, batch.vertOffset, batch.numVertices, batch.numTriangles)
+
+    def _get_vertex_keys(self, start, end):
+        return [get_vertex_key(vertex) for vertex in self.vertices[start:end]]
+
+    # Stores the result of _add_triangles_by_keys(). `lastBatchCounts` is the new (numVertices, numTriangles) of the last
+    # batch, or None if it didn't change. `newBatches` are [texIndex, flags, numVertices, numTriangles] lists.
+    # `vertexObjects` has the Vertex object for each of `vertexKeys`, or None where one should be made.
+    def _append_batched(self, lastBatchCounts, newBatches, vertexKeys, vertexObjects, triFlags, triIndices, uvs, uvsParsed):
+        if lastBatchCounts != None:
+            self.batches[-1].numVertices, self.batches[-1].numTriangles = lastBatchCounts
+        for texIndex, batchFlags, numVertices, numTriangles in newBatches:
             self._new_batch(texIndex, batchFlags)
-            vertIndices = [-1, -1, -1] # reset indices
-
-        for i in range(0, 3):
-            if vertIndices[i] == -1:
-                vertIndices[i] = len(self.vertices) - self.batches[-1].vertOffset
-                self.vertices.append(verts[i])
-                self.batches[-1].numVertices += 1
-
-        return vertIndices
-
-    def _check_if_texindex_or_flags_changed(self, texIndex, batchFlags):
-        curBatch = self.batches[-1]
-        return curBatch.texIndex != texIndex or curBatch.flags != batchFlags
+            self.batches[-1].numVertices = numVertices
+            self.batches[-1].numTriangles = numTriangles
+        bboxIsValid = self._is_bounding_box_valid()
+        for key, vertex in zip(vertexKeys, vertexObjects):
+            self.vertices.append(Vertex(*key) if vertex == None else vertex)
+        if bboxIsValid:
+            self._extend_bounding_box([key[0:3] for key in vertexKeys])
+        for i in range(0, len(triIndices)):
+            triUVs = []
+            for u, v in uvs[i]:
+                uv = UV(u, v)
+                uv.parsedU = uv.parsedV = uvsParsed[i]
+                triUVs.append(uv)
+            indices = triIndices[i]
+            self.triangles.append(Triangle(triFlags[i], indices[0], indices[1], indices[2], triUVs[0], triUVs[1], triUVs[2]))
+
+    # Maps the key of each vertex in the last batch to its index within the batch. The first vertex with a key wins.
+    # The map is only rebuilt if the last batch has changed since it was made.
+    def _get_batch_vertex_lookup(self, lastBatch):
+        if lastBatch == None:
+            return {}
+        vertexRange = (self.get_counts()[2], lastBatch[2], lastBatch[3])
+        if self._batchVertexLookupRange != vertexRange:
+            self._batchVertexLookup = {}
+            for i, key in enumerate(self._get_vertex_keys(lastBatch[2], lastBatch[2] + lastBatch[3])):
+                self._batchVertexLookup.setdefault(key, i)
+            self._batchVertexLookupRange = vertexRange
+        return self._batchVertexLookup
+
+    # Puts triangles into batches. A new batch is started when the texture or batch flags change, or when the current
+    # batch would go over MAX_NUM_TRIS_PER_BATCH or MAX_NUM_VERTS_PER_BATCH. Vertices are shared within a batch when
+    # their keys match. `cornerKeys` has three vertex keys per triangle, and `cornerVerts` has the matching Vertex
+    # objects (or is None). `uvs` has three (u, v) pairs per triangle.
+    def _add_triangles_by_keys(self, texIndices, batchFlags, flags, cornerKeys, cornerVerts, uvs, uvsParsed):
+        if len(cornerKeys) == 0:
+            return
+        lastBatch = self._get_last_batch()
+        lookup = self._get_batch_vertex_lookup(lastBatch)
+        batch = None
+        if lastBatch != None:
+            batch = [lastBatch[0], lastBatch[1], lastBatch[3], lastBatch[4]]
+        continuedBatch = batch
+        newBatches = []
+        vertexKeys = []
+        vertexObjects = []
+        triIndices = []
+        for i in range(0, len(cornerKeys)):
+            texIndex = texIndices[i]
+            if batch == None or batch[0] != texIndex or batch[1] != batchFlags[i] or batch[3] == MAX_NUM_TRIS_PER_BATCH:
+                batch = [texIndex, batchFlags[i], 0, 0]
+                newBatches.append(batch)
+                lookup = {}
+            keys = cornerKeys[i]
+            vertIndices = [lookup.get(keys[0], -1), lookup.get(keys[1], -1), lookup.get(keys[2], -1)]
+            if batch[2] + vertIndices.count(-1) > MAX_NUM_VERTS_PER_BATCH:
+                batch = [texIndex, batchFlags[i], 0, 0]
+                newBatches.append(batch)
+                lookup = {}
+                vertIndices = [-1, -1, -1] # reset indices
+            for j in range(0, 3):
+                if vertIndices[j] == -1:
+                    vertIndices[j] = batch[2]
+                    lookup.setdefault(keys[j], batch[2])
+                    batch[2] += 1
+                    vertexKeys.append(keys[j])
+                    vertexObjects.append(None if cornerVerts == None else cornerVerts[i][j])
+            batch[3] += 1
+            triIndices.append(vertIndices)
+        lastBatchCounts = None
+        if continuedBatch != None:
+            lastBatchCounts = (continuedBatch[2], continuedBatch[3])
+        self._append_batched(lastBatchCounts, newBatches, vertexKeys, vertexObjects, flags, triIndices, uvs, uvsParsed)
+        lastBatch = self._get_last_batch()
+        self._batchVertexLookup = lookup
+        self._batchVertexLookupRange = (self.get_counts()[2], lastBatch[2], lastBatch[3])
 
     def add_triangle(self, texIndex, batchFlags, flags, vert0, vert1, vert2, uv0, uv1, uv2):
-        if len(self.batches) == 0 or self._check_if_texindex_or_flags_changed(texIndex, batchFlags) or self.batches[-1].numTriangles == MAX_NUM_TRIS_PER_BATCH:
-            self._new_batch(texIndex, batchFlags)
-        indices = self._add_vertices_to_batch(texIndex, batchFlags, [vert0, vert1, vert2])
-        self.triangles.append(Triangle(flags, indices[0], indices[1], indices[2], uv0, uv1, uv2))
-        self.batches[-1].numTriangles += 1
-        
+        keys = (get_vertex_key(vert0), get_vertex_key(vert1), get_vertex_key(vert2))
+        uvs = ((uv0.u, uv0.v), (uv1.u, uv1.v), (uv2.u, uv2.v))
+        self._add_triangles_by_keys([texIndex], [batchFlags], [flags], [keys], [(vert0, vert1, vert2)], [uvs], [uv0.parsedU])
+
+    # Adds many triangles in one go. `positions` (N,3) and `colors` (N,4) hold the vertex values, which `indices` (T,3)
+    # points into, and `uvs` is (T,3,2). `texIndices`, `batchFlags`, `flags` and `uvsParsed` can either be a single
+    # value, or one value per triangle. `vertices` can optionally be the Vertex objects for `positions`, so that they
+    # get reused instead of copied. Gives the same result as calling add_triangle() for each triangle.
+    def add_triangles(self, texIndices, batchFlags, flags, positions, colors, indices, uvs, uvsParsed=False, vertices=None):
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+        numTriangles = len(indices)
+        texIndices = np.broadcast_to(texIndices, numTriangles).tolist()
+        batchFlags = np.broadcast_to(batchFlags, numTriangles).tolist()
+        flags = np.broadcast_to(flags, numTriangles).tolist()
+        uvsParsed = np.broadcast_to(uvsParsed, numTriangles).tolist()
+        positions = np.asarray(positions, dtype=np.int64).reshape(-1, 3)
+        colors = np.asarray(colors, dtype=np.int64).reshape(-1, 4)
+        keys = [tuple(key) for key in np.hstack((positions, colors)).tolist()]
+        indices = indices.tolist()
+        cornerKeys = [(keys[i0], keys[i1], keys[i2]) for i0, i1, i2 in indices]
+        cornerVerts = None
+        if vertices != None:
+            cornerVerts = [(vertices[i0], vertices[i1], vertices[i2]) for i0, i1, i2 in indices]
+        uvs = np.asarray(uvs, dtype=np.float64).reshape(-1, 3, 2).tolist()
+        self._add_triangles_by_keys(texIndices, batchFlags, flags, cornerKeys, cornerVerts, uvs, uvsParsed)
+
+    # Returns the number of vertices, triangles, and batches in this segment.
+    def get_counts(self):
+        return (len(self.vertices), len(self.triangles), len(self.batches))
+
+    def _get_batch_ranges(self):
+        batches = self.batches
+        vertOffsets = np.array([batch.vertOffset for batch in batches], dtype=np.int64)
+        triOffsets = np.array([batch.triOffset for batch in batches], dtype=np.int64)
+        numTriangles = np.array([batch.numTriangles for batch in batches], dtype=np.int64)
+        return (vertOffsets, triOffsets, numTriangles)
+
+    def _get_triangle_corners(self):
+        return np.array([(tri.vi0, tri.vi1, tri.vi2) for tri in self.triangles], dtype=np.int64).reshape(-1, 3)
+
+    def get_batch_texture_indices(self):
+        return np.array([batch.texIndex for batch in self.batches], dtype=np.int64)
+
+    # Changes the texture of every batch to remap[texIndex]. Batches without a texture (-1) are left alone.
+    def remap_texture_indices(self, remap):
+        for batch in self.batches:
+            if batch.texIndex != -1:
+                batch.texIndex = int(remap[batch.texIndex])
+
+    def _get_vertex_positions(self):
+        return np.array([(vert.x, vert.y, vert.z) for vert in self.vertices], dtype=np.int64).reshape(-1, 3)
+
+    def _get_triangle_lookup_signature(self):
+        return (id(self.batches), id(self.triangles), id(self.vertices)) + self.get_counts()
+
+    # Call this after changing the batches, triangles or vertices in place, so the lookup tables get rebuilt.
+    # (Adding triangles or replacing the lists is picked up automatically.)
+    def invalidate_triangle_lookup(self):
+        self._triangleLookup = None
+
+    # Returns (batchIndices, vertexIndices). batchIndices has the batch that each triangle is in (-1 if it isn't in one),
+    # and vertexIndices has the index of each triangle's corners in `vertices` (-1 if it isn't in a batch).
+    # If batches overlap, the first batch that contains a triangle wins.
+    def _get_triangle_lookup(self):
+        signature = self._get_triangle_lookup_signature()
+        if self._triangleLookup != None and self._triangleLookupSignature == signature:
+            return self._triangleLookup
+        vertOffsets, triOffsets, batchNumTriangles = self._get_batch_ranges()
+        corners = self._get_triangle_corners()
+        numTriangles = len(corners)
+        batchIndices = np.full(numTriangles, -1, dtype=np.int64)
+        # Going backwards, so that the first batch that contains a triangle wins.
+        for batchIndex in range(len(triOffsets) - 1, -1, -1):
+            start = max(int(triOffsets[batchIndex]), 0)
+            end = min(int(triOffsets[batchIndex] + batchNumTriangles[batchIndex]), numTriangles)
+            if start < end:
+                batchIndices[start:end] = batchIndex
+        hasBatch = batchIndices != -1
+        vertexIndices = np.full((numTriangles, 3), -1, dtype=np.int64)
+        vertexIndices[hasBatch] = vertOffsets[batchIndices[hasBatch]][:, None] + corners[hasBatch]
+        self._triangleLookup = (batchIndices, vertexIndices)
+        self._triangleLookupSignature = signature
+        self._trianglePositions = None
+        self._collisionData = None
+        return self._triangleLookup
+
+    # The batch that each triangle is in, or -1 if it isn't in one.
+    def get_triangle_batch_indices(self):
+        return self._get_triangle_lookup()[0]
+
+    # The index of each triangle's corners in `vertices`, as a (T,3) array.
+    def get_triangle_vertex_indices(self):
+        return self._get_triangle_lookup()[1]
+
+    # The positions of each triangle's corners, as a (T,3,3) array.
+    def get_triangle_positions(self):
+        batchIndices, vertexIndices = self._get_triangle_lookup()
+        if self._trianglePositions is None:
+            positions = self._get_vertex_positions()
+            if (batchIndices == -1).any() or (vertexIndices >= len(positions)).any():
+                raise SystemExit('Error: get_vertices_from_triangle_index() failed!')
+            self._trianglePositions = positions[vertexIndices]
+        return self._trianglePositions
+
     def get_texture_index_from_triangle_index(self, triIndex):
-        for b in self.batches:
-            if triIndex >= b.triOffset and triIndex < b.triOffset + b.numTriangles:
-                return b.texIndex
-        raise SystemExit('Error Invalid triangle index "' + str(triIndex) + '"')
+        batchIndices = self.get_triangle_batch_indices()
+        if triIndex < 0 or triIndex >= len(batchIndices) or batchIndices[triIndex] == -1:
+            raise SystemExit('Error Invalid triangle index "' + str(triIndex) + '"')
+        return self.batches[int(batchIndices[triIndex])].texIndex
 
     def get_vertices_from_triangle_index(self, triIndex):
-        vert0 = vert1 = vert2 = None
-
-        tri = self.triangles[triIndex]
-        for batch in self.batches:
-            if triIndex >= batch.triOffset and triIndex < batch.triOffset + batch.numTriangles:
-                vert0 = self.vertices[batch.vertOffset + tri.vi0]
-                vert1 = self.vertices[batch.vertOffset + tri.vi1]
-                vert2 = self.vertices[batch.vertOffset + tri.vi2]
-        
-        if vert0 == None or vert1 == None or vert2 == None:
+        vertexIndices = self.get_triangle_vertex_indices()
+        if triIndex < 0 or triIndex >= len(vertexIndices) or vertexIndices[triIndex][0] == -1:
             raise SystemExit('Error: get_vertices_from_triangle_index() failed!')
-
-        return (vert0, vert1, vert2)
+        vertices = self.vertices
+        vi0, vi1, vi2 = vertexIndices[triIndex].tolist()
+        return (vertices[vi0], vertices[vi1], vertices[vi2])
 
     def vertex_is_in_other(self, v0, vo0, vo1, vo2):
         if v0.in_same_position_as_other_vertex(vo0):
@@ -282,52 +446,50 @@ class Model3DSegment:
             return True
         return False
 
-    def get_collision_data_for_triangle(self, triIndex):
-        outIndices = [ triIndex, triIndex, triIndex ]
-        checkIndices = [ True, True, True ]
+    # Returns the neighbouring triangle across each edge (01, 12, 20) of every triangle, as a (T,3) array.
+    # See get_collision_neighbours() for how neighbours are picked.
+    def get_collision_data(self):
+        self._get_triangle_lookup()
+        if self._collisionData is None:
+            self._collisionData = get_collision_neighbours(self.get_triangle_positions())
+        return self._collisionData
 
-        vert0, vert1, vert2 = self.get_vertices_from_triangle_index(triIndex)
+    def get_collision_data_for_triangle(self, triIndex):
+        return tuple(self.get_collision_data()[triIndex].tolist())
 
-        for i in range(0, len(self.triangles)):
-            if i == triIndex:
-                continue
-            if not checkIndices[0] and not checkIndices[1] and not checkIndices[2]: # Found all edges, so exit.
-                break
-            
-            otherVert0, otherVert1, otherVert2 = self.get_vertices_from_triangle_index(i)
-            vert0IsInOther = self.vertex_is_in_other(vert0, otherVert0, otherVert1, otherVert2)
-            vert1IsInOther = self.vertex_is_in_other(vert1, otherVert0, otherVert1, otherVert2)
-            vert2IsInOther = self.vertex_is_in_other(vert2, otherVert0, otherVert1, otherVert2)
-
-            if checkIndices[0] and vert0IsInOther and vert1IsInOther: # Check edge 01
-                outIndices[0] = i
-                checkIndices[0] = False
-            if checkIndices[1] and vert1IsInOther and vert2IsInOther: # Check edge 12
-                outIndices[1] = i
-                checkIndices[1] = False
-            if checkIndices[2] and vert2IsInOther and vert0IsInOther: # Check edge 20
-                outIndices[2] = i
-                checkIndices[2] = False
-
-        return tuple(outIndices)
+    def _get_bounding_box_signature(self):
+        return (id(self.vertices), len(self.vertices))
 
-    def get_bounding_box(self):
-        if self.bbox != None:
-            return self.bbox
+    # The bounding box is kept up to date as vertices get added. Call this after changing vertices in place, so it
+    # gets recalculated the next time it is needed. (Replacing the vertex list is picked up automatically.)
+    def mark_bounding_box_dirty(self):
+        self.bboxDirty = True
 
-        maxPos = [-999999, -999999, -999999]
-        minPos = [999999, 999999, 999999]
+    def set_bounding_box(self, bbox):
+        self.bbox = (list(bbox[0]), list(bbox[1]))
+        self.bboxDirty = False
+        self._bboxSignature = self._get_bounding_box_signature()
 
-        for vert in self.vertices:
-            minPos[0] = min(minPos[0], vert.x)
-            minPos[1] = min(minPos[1], vert.y)
-            minPos[2] = min(minPos[2], vert.z)
-            maxPos[0] = max(maxPos[0], vert.x)
-            maxPos[1] = max(maxPos[1], vert.y)
-            maxPos[2] = max(maxPos[2], vert.z)
+    def _is_bounding_box_valid(self):
+        return not self.bboxDirty and self.bbox != None and self._bboxSignature == self._get_bounding_box_signature()
 
-        self.bbox = (minPos, maxPos)
+    # Grows the bounding box to fit new vertex positions. Only call this if the box was valid before they were added.
+    def _extend_bounding_box(self, positions):
+        positions = np.asarray(positions, dtype=np.int64).reshape(-1, 3)
+        minPos, maxPos = self.bbox
+        if len(positions) > 0:
+            minPos = np.minimum(minPos, positions.min(axis=0)).tolist()
+            maxPos = np.maximum(maxPos, positions.max(axis=0)).tolist()
+        self.set_bounding_box((minPos, maxPos))
 
+    def get_bounding_box(self):
+        if self._is_bounding_box_valid():
+            return self.bbox
+        positions = self._get_vertex_positions()
+        if len(positions) == 0:
+            self.set_bounding_box(([999999, 999999, 999999], [-999999, -999999, -999999]))
+        else:
+            self.set_bounding_box((positions.min(axis=0).tolist(), positions.max(axis=0).tolist()))
         return self.bbox
 
     def get_bounding_box_size(self):
@@ -385,11 +547,102 @@ class BspTreeNode:
     def __repr__(self):
         return self.__str__()
 
+SPLIT_AXISES = ['X', 'Y', 'Z']
+
+# The nodes are stored as flat arrays in the same order as the level binary, so node `i` is at index `i` and
+# `leftIndices`/`rightIndices` are -1 when there is no child. Going left into a missing child means the point
+# is in segment `segmentNumber - 1`, and going right means it is in segment `segmentNumber`.
 class BspTree:
     def __init__(self):
-        self.rootNode = None
+        self.set_nodes([], [], [], [], [])
         self.bitfields = []
 
+    # `splitAxes` are 0, 1 or 2 for X, Y and Z. Nodes that can't be reached from the root are cleared, and dropped
+    # from the end.
+    def set_nodes(self, splitAxes, splitValues, segmentNumbers, leftIndices, rightIndices):
+        self.splitAxes = np.array(splitAxes, dtype=np.int64).reshape(-1)
+        self.splitValues = np.array(splitValues, dtype=np.int64).reshape(-1)
+        self.segmentNumbers = np.array(segmentNumbers, dtype=np.int64).reshape(-1)
+        self.leftIndices = np.array(leftIndices, dtype=np.int64).reshape(-1)
+        self.rightIndices = np.array(rightIndices, dtype=np.int64).reshape(-1)
+        numNodes = self.get_num_nodes()
+        if numNodes == 0:
+            return
+        isReachable = np.zeros(numNodes, dtype=bool)
+        stack = [0]
+        while len(stack) > 0:
+            index = stack.pop()
+            if isReachable[index]:
+                continue
+            isReachable[index] = True
+            for child in (int(self.leftIndices[index]), int(self.rightIndices[index])):
+                if child == -1:
+                    continue
+                if child < 0 or child >= numNodes:
+                    raise SystemExit('Error: BSP tree node ' + str(index) + ' points to node ' + str(child) + ', which does not exist.')
+                stack.append(child)
+        numNodes = int(np.flatnonzero(isReachable)[-1]) + 1
+        for name in ('splitAxes', 'splitValues', 'segmentNumbers', 'leftIndices', 'rightIndices'):
+            nodeArray = getattr(self, name)[:numNodes]
+            nodeArray[~isReachable[:numNodes]] = 0
+            setattr(self, name, nodeArray)
+
+    def get_num_nodes(self):
+        return len(self.splitAxes)
+
+    # The tree as linked BspTreeNode objects. These are a copy, so set `rootNode` again after changing them.
+    @property
+    def rootNode(self):
+        if self.get_num_nodes() == 0:
+            return None
+        nodes = [BspTreeNode(SPLIT_AXISES[axis], value, segment, left, None, right, None) for axis, value, segment, left, right in
+                 zip(self.splitAxes.tolist(), self.splitValues.tolist(), self.segmentNumbers.tolist(), self.leftIndices.tolist(), self.rightIndices.tolist())]
+        for node in nodes:
+            if node.leftIndex != -1:
+                node.left = nodes[node.leftIndex]
+            if node.rightIndex != -1:
+                node.right = nodes[node.rightIndex]
+        return nodes[0]
+
+    # Each node is placed at its parent's leftIndex/rightIndex, with the root at 0.
+    @rootNode.setter
+    def rootNode(self, rootNode):
+        nodes = {}
+        stack = [(0, rootNode)]
+        while len(stack) > 0:
+            index, node = stack.pop()
+            if index == -1 or node == None or index in nodes:
+                continue
+            nodes[index] = node
+            stack.append((node.rightIndex, node.right))
+            stack.append((node.leftIndex, node.left))
+        numNodes = max(nodes.keys()) + 1 if len(nodes) > 0 else 0
+        values = np.zeros((5, numNodes), dtype=np.int64)
+        for index, node in nodes.items():
+            values[:, index] = (SPLIT_AXISES.index(node.splitAxis.upper()), node.splitValue, node.segmentNumber, node.leftIndex, node.rightIndex)
+        self.set_nodes(*values)
+
+    # Returns the segment that each point in `points` (an (N,3) array) is in. Every point is in segment 0 if
+    # there is no tree.
+    def locate(self, points):
+        points = np.asarray(points).reshape(-1, 3)
+        segments = np.zeros(len(points), dtype=np.int64)
+        if self.get_num_nodes() == 0:
+            return segments
+        queries = np.arange(len(points))
+        nodes = np.zeros(len(points), dtype=np.int64)
+        # A tree can't be deeper than it has nodes, unless it loops.
+        for i in range(0, self.get_num_nodes()):
+            goLeft = points[queries, self.splitAxes[nodes]] < self.splitValues[nodes]
+            children = np.where(goLeft, self.leftIndices[nodes], self.rightIndices[nodes])
+            isDone = children == -1
+            segments[queries[isDone]] = self.segmentNumbers[nodes[isDone]] - goLeft[isDone]
+            queries = queries[~isDone]
+            nodes = children[~isDone]
+            if len(queries) == 0:
+                return segments
+        raise SystemExit('Error: The BSP tree has a loop in it.')
+
 class Model3D:
     def __init__(self):
         self.segments = []
@@ -398,23 +651,11 @@ class Model3D:
         self.bspTree = BspTree()
         self.bbox = None
 
+    # Combines the bounding boxes of the segments, so it stays up to date as they change.
     def get_bounding_box(self):
-        if self.bbox != None:
+        if len(self.segments) == 0:
+            self.bbox = ([999999, 999999, 999999], [-999999, -999999, -999999])
             return self.bbox
-
-        maxPos = [-999999, -999999, -999999]
-        minPos = [999999, 999999, 999999]
-
-        for segment in self.segments:
-            segBox = segment.get_bounding_box()
-            minPos[0] = min(minPos[0], segBox[0][0])
-            minPos[1] = min(minPos[1], segBox[0][1])
-            minPos[2] = min(minPos[2], segBox[0][2])
-            maxPos[0] = max(maxPos[0], segBox[1][0])
-            maxPos[1] = max(maxPos[1], segBox[1][1])
-            maxPos[2] = max(maxPos[2], segBox[1][2])
-
-        self.bbox = (minPos, maxPos)
-
+        segmentBoxes = np.array([segment.get_bounding_box() for segment in self.segments], dtype=np.int64)
+        self.bbox = (segmentBoxes[:, 0].min(axis=0).tolist(), segmentBoxes[:, 1].max(axis=0).tolist())
         return self.bbox
-
@@ -0,0 +1,97 @@
+from model import *
+from model_columnar import *
+import numpy as np
+from PIL import Image
+
+# A Model3D saved as NumPy arrays in a single .npz file, so it can be loaded again without parsing an OBJ, loading
+# PNGs, rebuilding batches or calculating bitfields. The geometry of every segment is stored in the same columns
+# as ColumnarModel3DSegment, one after another, with the counts of each segment in `segmentCounts`.
+
+MODEL_CACHE_EXTENSION = '.npz'
+MODEL_CACHE_VERSION = 1
+
+def _get_texture_arrays(textures):
+    names = np.array([texture.name for texture in textures], dtype=np.str_)
+    values = np.array([(texture.width, texture.height, texture.format, texture.collisionType, texture.originalTexIndex) for texture in textures], dtype=np.int64).reshape(-1, 5)
+    images = [None if texture.tex == None else np.asarray(texture.tex.convert('RGBA'), dtype=np.uint8) for texture in textures]
+    # The size of each image, or -1 if the texture doesn't have one.
+    imageSizes = np.array([(-1, -1) if image is None else image.shape[0:2] for image in images], dtype=np.int64).reshape(-1, 2)
+    pixels = [image.reshape(-1) for image in images if image is not None]
+    pixels = np.concatenate(pixels) if len(pixels) > 0 else np.zeros(0, dtype=np.uint8)
+    return { 'textureNames': names, 'textureValues': values, 'textureImageSizes': imageSizes, 'texturePixels': pixels }
+
+def _get_segment_arrays(segments):
+    segments = [to_columnar(segment) for segment in segments]
+    arrays = { 'segmentCounts': np.array([segment.get_counts() for segment in segments], dtype=np.int64).reshape(-1, 3) }
+    arrays['segmentBoundingBoxes'] = np.array([segment.get_bounding_box() for segment in segments], dtype=np.int64).reshape(-1, 2, 3)
+    for name, (group, dtype, shape) in COLUMN_TYPES.items():
+        columns = [getattr(segment, name) for segment in segments]
+        arrays[name] = np.concatenate(columns) if len(columns) > 0 else np.zeros((0,) + shape, dtype=dtype)
+    return arrays
+
+def _get_bsp_tree_arrays(bspTree, numSegments):
+    arrays = {
+        'bspSplitAxes': bspTree.splitAxes,
+        'bspSplitValues': bspTree.splitValues,
+        'bspSegmentNumbers': bspTree.segmentNumbers,
+        'bspLeftIndices': bspTree.leftIndices,
+        'bspRightIndices': bspTree.rightIndices,
+    }
+    # Bitfields can be bigger than 64 bits, so they are stored as big-endian bytes like in the level binary.
+    bitfields = bspTree.bitfields
+    numBytes = max([(numSegments + 7) // 8] + [(bitfield.bit_length() + 7) // 8 for bitfield in bitfields])
+    data = b''.join([bitfield.to_bytes(numBytes, 'big') for bitfield in bitfields])
+    arrays['bitfields'] = np.frombuffer(data, dtype=np.uint8).reshape(len(bitfields), numBytes)
+    return arrays
+
+def export_model_cache(model, args):
+    arrays = { 'version': np.array(MODEL_CACHE_VERSION), 'hasTrianglesWithoutATexture': np.array(model.hasTrianglesWithoutATexture) }
+    arrays.update(_get_texture_arrays(model.textures))
+    arrays.update(_get_segment_arrays(model.segments))
+    arrays.update(_get_bsp_tree_arrays(model.bspTree, len(model.segments)))
+    with open(args.output, 'wb') as outFile:
+        np.savez(outFile, **arrays)
+
+def _load_textures(model, arrays):
+    names = arrays['textureNames'].tolist()
+    values = arrays['textureValues'].tolist()
+    imageSizes = arrays['textureImageSizes'].tolist()
+    pixels = arrays['texturePixels']
+    offset = 0
+    for name, (width, height, format, collisionType, originalTexIndex), (imageHeight, imageWidth) in zip(names, values, imageSizes):
+        tex = None
+        if imageHeight != -1:
+            size = imageHeight * imageWidth * 4
+            tex = Image.fromarray(pixels[offset:offset + size].reshape(imageHeight, imageWidth, 4), 'RGBA')
+            offset += size
+        texture = TextureNode(tex, width, height, format, collisionType, originalTexIndex)
+        texture.set_name(name)
+        model.textures.append(texture)
+
+def _load_segments(model, arrays):
+    columns = { name: arrays[name] for name in COLUMN_TYPES }
+    countIndices = { COLUMNS_VERTICES: 0, COLUMNS_TRIANGLES: 1, COLUMNS_BATCHES: 2 }
+    offsets = np.zeros(3, dtype=np.int64)
+    for counts, bbox in zip(arrays['segmentCounts'], arrays['segmentBoundingBoxes'].tolist()):
+        segment = ColumnarModel3DSegment()
+        segmentColumns = {}
+        for name, (group, dtype, shape) in COLUMN_TYPES.items():
+            i = countIndices[group]
+            segmentColumns[name] = columns[name][offsets[i]:offsets[i] + counts[i]]
+        offsets += counts
+        segment.set_columns(segmentColumns)
+        if counts[0] > 0:
+            segment.set_bounding_box((bbox[0], bbox[1]))
+        model.segments.append(segment)
+
+def import_model_cache(args):
+    with np.load(args.input, allow_pickle=False) as arrays:
+        if int(arrays['version']) != MODEL_CACHE_VERSION:
+            raise SystemExit('Error: "' + args.input + '" is from a different version of the tool. Please make it again.')
+        model = Model3D()
+        model.hasTrianglesWithoutATexture = bool(arrays['hasTrianglesWithoutATexture'])
+        _load_textures(model, arrays)
+        _load_segments(model, arrays)
+        model.bspTree.set_nodes(arrays['bspSplitAxes'], arrays['bspSplitValues'], arrays['bspSegmentNumbers'], arrays['bspLeftIndices'], arrays['bspRightIndices'])
+        model.bspTree.bitfields = [int.from_bytes(bitfield.tobytes(), 'big') for bitfield in arrays['bitfields']]
+    return model
@@ -0,0 +1,279 @@
+import numpy as np
+from model import *
+
+COLUMNS_VERTICES = 'vertices'
+COLUMNS_TRIANGLES = 'triangles'
+COLUMNS_BATCHES = 'batches'
+
+# A read-only list of objects, which are built from a segment's columns as they get accessed.
+# Changing one of these objects does not change the segment.
+class ColumnarObjectList:
+    def __init__(self, length, getItem):
+        self._length = length
+        self._get_item = getItem
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._get_item(i) for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if index < 0 or index >= self._length:
+            raise IndexError('list index out of range')
+        return self._get_item(index)
+
+    def __iter__(self):
+        for i in range(0, self._length):
+            yield self._get_item(i)
+
+def _column(name, group):
+    def get_column(self):
+        self._load_columns(group)
+        return self._columns[name][:self._counts[group]]
+    return property(get_column)
+
+# Storage for each column: (group, dtype, shape of one element)
+COLUMN_TYPES = {
+    'positions':         (COLUMNS_VERTICES,  np.int16,   (3,)),
+    'colors':            (COLUMNS_VERTICES,  np.uint8,   (4,)),
+    'triFlags':          (COLUMNS_TRIANGLES, np.uint8,   ()),
+    'triIndices':        (COLUMNS_TRIANGLES, np.uint8,   (3,)),
+    'triUVs':            (COLUMNS_TRIANGLES, np.float64, (3, 2)),
+    'triUVsParsed':      (COLUMNS_TRIANGLES, bool,       ()),
+    'batchTexIndices':   (COLUMNS_BATCHES,   np.int64,   ()),
+    'batchFlags':        (COLUMNS_BATCHES,   np.int64,   ()),
+    'batchVertOffsets':  (COLUMNS_BATCHES,   np.int64,   ()),
+    'batchNumVertices':  (COLUMNS_BATCHES,   np.int64,   ()),
+    'batchTriOffsets':   (COLUMNS_BATCHES,   np.int64,   ()),
+    'batchNumTriangles': (COLUMNS_BATCHES,   np.int64,   ()),
+}
+
+def _to_column(name, values, count):
+    group, dtype, shape = COLUMN_TYPES[name]
+    # Going through int64 makes out of range integers wrap around, the same way the exporter masks them.
+    if np.issubdtype(dtype, np.integer):
+        values = np.asarray(values, dtype=np.int64)
+    return np.asarray(values).astype(dtype).reshape((count,) + shape)
+
+# A Model3DSegment that keeps its geometry in NumPy arrays ("columns") instead of one object per
+# vertex/triangle/batch. `vertices`, `triangles` and `batches` still work, but they return read-only
+# lists of objects that are built on access, so code should use the columns where it can:
+#   positions (N,3) int16, colors (N,4) uint8
+#   triFlags (T,) uint8, triIndices (T,3) uint8, triUVs (T,3,2) float64, triUVsParsed (T,) bool
+#   batchTexIndices, batchFlags, batchVertOffsets, batchNumVertices, batchTriOffsets, batchNumTriangles (B,) int64
+class ColumnarModel3DSegment(Model3DSegment):
+    def __init__(self):
+        self._columns = {}
+        self._counts = { COLUMNS_VERTICES: 0, COLUMNS_TRIANGLES: 0, COLUMNS_BATCHES: 0 }
+        self._unloadedColumns = set()
+        # Changes whenever a group of columns does, so cached lookups and bounding boxes know to rebuild.
+        self._columnVersions = { COLUMNS_VERTICES: 0, COLUMNS_TRIANGLES: 0, COLUMNS_BATCHES: 0 }
+        for name in COLUMN_TYPES:
+            self._columns[name] = _to_column(name, [], 0)
+        super().__init__()
+
+    positions = _column('positions', COLUMNS_VERTICES)
+    colors = _column('colors', COLUMNS_VERTICES)
+    triFlags = _column('triFlags', COLUMNS_TRIANGLES)
+    triIndices = _column('triIndices', COLUMNS_TRIANGLES)
+    triUVs = _column('triUVs', COLUMNS_TRIANGLES)
+    triUVsParsed = _column('triUVsParsed', COLUMNS_TRIANGLES)
+    batchTexIndices = _column('batchTexIndices', COLUMNS_BATCHES)
+    batchFlags = _column('batchFlags', COLUMNS_BATCHES)
+    batchVertOffsets = _column('batchVertOffsets', COLUMNS_BATCHES)
+    batchNumVertices = _column('batchNumVertices', COLUMNS_BATCHES)
+    batchTriOffsets = _column('batchTriOffsets', COLUMNS_BATCHES)
+    batchNumTriangles = _column('batchNumTriangles', COLUMNS_BATCHES)
+
+    # Subclasses can leave a group of columns unloaded, and fill it in here when it is first needed.
+    def _decode_columns(self, group):
+        pass
+
+    def _load_columns(self, group):
+        if group in self._unloadedColumns:
+            self._unloadedColumns.discard(group)
+            self._decode_columns(group)
+
+    def _set_columns(self, group, count, values):
+        self._unloadedColumns.discard(group)
+        self._columnVersions[group] += 1
+        for name in values:
+            self._columns[name] = _to_column(name, values[name], count)
+        self._counts[group] = count
+
+    def set_vertex_columns(self, positions, colors):
+        self._set_columns(COLUMNS_VERTICES, len(positions), { 'positions': positions, 'colors': colors })
+
+    def set_triangle_columns(self, flags, indices, uvs, uvsParsed):
+        self._set_columns(COLUMNS_TRIANGLES, len(flags), { 'triFlags': flags, 'triIndices': indices, 'triUVs': uvs, 'triUVsParsed': uvsParsed })
+
+    def set_batch_columns(self, texIndices, flags, vertOffsets, numVertices, triOffsets, numTriangles):
+        self._set_columns(COLUMNS_BATCHES, len(texIndices), {
+            'batchTexIndices': texIndices, 'batchFlags': flags,
+            'batchVertOffsets': vertOffsets, 'batchNumVertices': numVertices,
+            'batchTriOffsets': triOffsets, 'batchNumTriangles': numTriangles })
+
+    # Every column by name, e.g. to send a segment to another process.
+    def get_columns(self):
+        return { name: getattr(self, name) for name in COLUMN_TYPES }
+
+    # Sets every column from a dict like the one get_columns() returns.
+    def set_columns(self, columns):
+        for group, set_group in [(COLUMNS_VERTICES, self.set_vertex_columns), (COLUMNS_TRIANGLES, self.set_triangle_columns), (COLUMNS_BATCHES, self.set_batch_columns)]:
+            # The setters take the columns of their group in the same order as COLUMN_TYPES.
+            set_group(*[columns[name] for name, (columnGroup, dtype, shape) in COLUMN_TYPES.items() if columnGroup == group])
+
+    # Adds rows to a group of columns, doubling the size of the arrays whenever they run out of room.
+    def _append_rows(self, group, count, values):
+        self._load_columns(group)
+        self._columnVersions[group] += 1
+        start = self._counts[group]
+        for name in values:
+            column = self._columns[name]
+            if start + count > len(column):
+                grown = np.zeros((max(16, len(column) * 2, start + count),) + column.shape[1:], dtype=column.dtype)
+                grown[:start] = column[:start]
+                self._columns[name] = column = grown
+            column[start:start + count] = _to_column(name, values[name], count)
+        self._counts[group] = start + count
+
+    def get_counts(self):
+        return (self._counts[COLUMNS_VERTICES], self._counts[COLUMNS_TRIANGLES], self._counts[COLUMNS_BATCHES])
+
+    # ---- Object views ---- #
+
+    def _get_vertex(self, index):
+        x, y, z = self._columns['positions'][index].tolist()
+        r, g, b, a = self._columns['colors'][index].tolist()
+        return Vertex(x, y, z, r, g, b, a)
+
+    def _get_triangle(self, index):
+        vi0, vi1, vi2 = self._columns['triIndices'][index].tolist()
+        parsed = bool(self._columns['triUVsParsed'][index])
+        uvs = []
+        for u, v in self._columns['triUVs'][index].tolist():
+            uv = UV(u, v)
+            uv.parsedU = uv.parsedV = parsed
+            uvs.append(uv)
+        return Triangle(int(self._columns['triFlags'][index]), vi0, vi1, vi2, uvs[0], uvs[1], uvs[2])
+
+    def _get_batch(self, index):
+        c = self._columns
+        return Model3DBatch(int(c['batchTexIndices'][index]), int(c['batchFlags'][index]),
+            int(c['batchVertOffsets'][index]), int(c['batchNumVertices'][index]),
+            int(c['batchTriOffsets'][index]), int(c['batchNumTriangles'][index]))
+
+    @property
+    def vertices(self):
+        self._load_columns(COLUMNS_VERTICES)
+        return ColumnarObjectList(self._counts[COLUMNS_VERTICES], self._get_vertex)
+
+    @vertices.setter
+    def vertices(self, vertices):
+        positions = [(v.x, v.y, v.z) for v in vertices]
+        colors = [(v.color.r, v.color.g, v.color.b, v.color.a) for v in vertices]
+        self.set_vertex_columns(positions, colors)
+
+    @property
+    def triangles(self):
+        self._load_columns(COLUMNS_TRIANGLES)
+        return ColumnarObjectList(self._counts[COLUMNS_TRIANGLES], self._get_triangle)
+
+    @triangles.setter
+    def triangles(self, triangles):
+        flags = [tri.flags for tri in triangles]
+        indices = [(tri.vi0, tri.vi1, tri.vi2) for tri in triangles]
+        uvs = [((tri.uv0.u, tri.uv0.v), (tri.uv1.u, tri.uv1.v), (tri.uv2.u, tri.uv2.v)) for tri in triangles]
+        uvsParsed = [tri.uv0.parsedU for tri in triangles]
+        self.set_triangle_columns(flags, indices, uvs, uvsParsed)
+
+    @property
+    def batches(self):
+        self._load_columns(COLUMNS_BATCHES)
+        return ColumnarObjectList(self._counts[COLUMNS_BATCHES], self._get_batch)
+
+    @batches.setter
+    def batches(self, batches):
+        self.set_batch_columns([b.texIndex for b in batches], [b.flags for b in batches],
+            [b.vertOffset for b in batches], [b.numVertices for b in batches],
+            [b.triOffset for b in batches], [b.numTriangles for b in batches])
+
+    # ---- Building ---- #
+
+    def _get_last_batch(self):
+        numBatches = len(self.batchTexIndices)
+        if numBatches == 0:
+            return None
+        c = self._columns
+        i = numBatches - 1
+        return (int(c['batchTexIndices'][i]), int(c['batchFlags'][i]), int(c['batchVertOffsets'][i]),
+            int(c['batchNumVertices'][i]), int(c['batchNumTriangles'][i]))
+
+    def _get_vertex_keys(self, start, end):
+        values = np.hstack((self.positions[start:end], self.colors[start:end])).tolist()
+        return [tuple(key) for key in values]
+
+    def _append_batched(self, lastBatchCounts, newBatches, vertexKeys, vertexObjects, triFlags, triIndices, uvs, uvsParsed):
+        c = self._columns
+        numBatches = len(self.batchTexIndices)
+        vertEnd = triEnd = 0
+        if numBatches > 0:
+            if lastBatchCounts != None:
+                self._columnVersions[COLUMNS_BATCHES] += 1
+                c['batchNumVertices'][numBatches - 1], c['batchNumTriangles'][numBatches - 1] = lastBatchCounts
+            vertEnd = int(c['batchVertOffsets'][numBatches - 1] + c['batchNumVertices'][numBatches - 1])
+            triEnd = int(c['batchTriOffsets'][numBatches - 1] + c['batchNumTriangles'][numBatches - 1])
+        if len(newBatches) > 0:
+            batches = np.array(newBatches, dtype=np.int64).reshape(-1, 4)
+            self._append_rows(COLUMNS_BATCHES, len(batches), {
+                'batchTexIndices': batches[:, 0], 'batchFlags': batches[:, 1],
+                'batchVertOffsets': vertEnd + np.cumsum(batches[:, 2]) - batches[:, 2], 'batchNumVertices': batches[:, 2],
+                'batchTriOffsets': triEnd + np.cumsum(batches[:, 3]) - batches[:, 3], 'batchNumTriangles': batches[:, 3] })
+        vertexKeys = np.array(vertexKeys, dtype=np.int64).reshape(-1, 7)
+        bboxIsValid = self._is_bounding_box_valid()
+        self._append_rows(COLUMNS_VERTICES, len(vertexKeys), { 'positions': vertexKeys[:, 0:3], 'colors': vertexKeys[:, 3:7] })
+        if bboxIsValid:
+            self._extend_bounding_box(vertexKeys[:, 0:3])
+        self._append_rows(COLUMNS_TRIANGLES, len(triIndices), { 'triFlags': triFlags, 'triIndices': triIndices, 'triUVs': uvs, 'triUVsParsed': uvsParsed })
+
+    # ---- Queries ---- #
+
+    def _get_batch_ranges(self):
+        return (self.batchVertOffsets, self.batchTriOffsets, self.batchNumTriangles)
+
+    def _get_triangle_corners(self):
+        return self.triIndices.astype(np.int64)
+
+    def get_batch_texture_indices(self):
+        return self.batchTexIndices.copy()
+
+    def remap_texture_indices(self, remap):
+        texIndices = self.batchTexIndices
+        hasTexture = texIndices != -1
+        newTexIndices = texIndices.copy()
+        newTexIndices[hasTexture] = np.asarray(remap, dtype=np.int64)[texIndices[hasTexture]]
+        self._set_columns(COLUMNS_BATCHES, len(texIndices), { 'batchTexIndices': newTexIndices })
+
+    def _get_vertex_positions(self):
+        return self.positions.astype(np.int64)
+
+    def _get_triangle_lookup_signature(self):
+        for group in [COLUMNS_VERTICES, COLUMNS_TRIANGLES, COLUMNS_BATCHES]:
+            self._load_columns(group)
+        return tuple(self._columnVersions.values()) + self.get_counts()
+
+    def _get_bounding_box_signature(self):
+        return self._columnVersions[COLUMNS_VERTICES]
+
+# Returns `segment` if it is already columnar, otherwise a columnar copy of it.
+def to_columnar(segment):
+    if isinstance(segment, ColumnarModel3DSegment):
+        return segment
+    columnar = ColumnarModel3DSegment()
+    columnar.vertices = segment.vertices
+    columnar.triangles = segment.triangles
+    columnar.batches = segment.batches
+    columnar.set_bounding_box(segment.get_bounding_box())
+    return columnar
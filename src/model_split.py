@@ -1,6 +1,13 @@
 from model import *
+import numpy as np
 import json
-from sutherlandhodgman import clip_AABB
+from model_columnar import ColumnarModel3DSegment
+from sutherlandhodgman import clip_triangles_AABB, PLANE_THICKNESS_EPSILON
+from shared_arrays import SharedArrays
+from split_cache import SplitCache
+from split_cost import get_cost_split_tree
+from concurrent.futures import ProcessPoolExecutor
+import os
 from numpy import array, copy, cross, divide, multiply, dot, sqrt as numpy_sqrt
 from segment_bitfield_generator import calculate_segment_bitfields
 
@@ -13,6 +20,7 @@ class TriangleData:
             array([vert1.x, vert1.y, vert1.z]),
             array([vert2.x, vert2.y, vert2.z])
         ]
+        self.colors = [(vert.color.r, vert.color.g, vert.color.b, vert.color.a) for vert in (vert0, vert1, vert2)]
 
 class SplitNode:
     def __init__(self, axis, value):
@@ -20,7 +28,7 @@ class SplitNode:
         assert self.axis == 'X' or self.axis == 'Y' or self.axis == 'Z'
         self.value = value
 
-def _get_triangles_data(model):
+def get_triangles_data(model):
     trianglesData = []
     for segment in model.segments:
         for batch in segment.batches:
@@ -126,67 +134,298 @@ def magnitude(vec):
     vec2 = divide(vec, MAG_SCALE_FACTOR)
     return multiply(numpy_sqrt(vec2.dot(vec2)), MAG_SCALE_FACTOR)
 
+# magnitude() for each vector in an (N,3) array. matmul does the same dot product as magnitude(), so the results match.
+def magnitudes(vecs):
+    vecs2 = divide(vecs, MAG_SCALE_FACTOR)
+    return multiply(numpy_sqrt((vecs2[:, None, :] @ vecs2[:, :, None])[:, 0, 0]), MAG_SCALE_FACTOR)
+
 # `point` is a vertex that is somewhere on the triangle itself.
 # Taken from: https://answers.unity.com/questions/383804/calculate-uv-coordinates-of-3d-point-on-plane-of-m.html
 def calculate_uv_for_point_in_triangle(point, vert0, vert1, vert2, tri):
-    # calculate vectors from point f to vertices p1, p2 and p3:
-    f1 = vert0 - point
-    f2 = vert1 - point
-    f3 = vert2 - point
-    # calculate the areas and factors (order of parameters doesn't matter):
-    a = magnitude(cross(vert0-vert1, vert0-vert2))
-    if a == 0:
-        a = 0.0001 # Don't want division by 0.
-    a1 = magnitude(cross(f2, f3)) / a
-    a2 = magnitude(cross(f3, f1)) / a
-    a3 = magnitude(cross(f1, f2)) / a
+    weights = calculate_barycentric_weights(array([point]), array([[vert0, vert1, vert2]]))
     # Put triangle's UV coordinates into numpy arrays
-    uv1 = array([ tri.uv0.u, tri.uv0.v ])
-    uv2 = array([ tri.uv1.u, tri.uv1.v ])
-    uv3 = array([ tri.uv2.u, tri.uv2.v ])
+    uvs = array([[[ tri.uv0.u, tri.uv0.v ], [ tri.uv1.u, tri.uv1.v ], [ tri.uv2.u, tri.uv2.v ]]])
     # find the uv corresponding to point f (uv1/uv2/uv3 are associated to p1/p2/p3):
-    uv = uv1 * a1 + uv2 * a2 + uv3 * a3
+    uv = interpolate_corner_values(weights, uvs)[0]
     # Return the new UV
     return UV(uv[0], uv[1])
 
-def get_bsp_node(splitDataNode, index):
-    nodeIndex = index[0]
-    index[0] += 1
-    left = right = None
+# Batched version of calculate_uv_for_point_in_triangle(). Returns the weights of the corners of each point's
+# triangle, as an (N,3) array. `points` is an (N,3) array, and `corners` is an (N,3,3) array with the corners of the
+# triangle that each point is on.
+def calculate_barycentric_weights(points, corners):
+    f = corners - points[:, None, :]
+    a = magnitudes(cross(corners[:, 0] - corners[:, 1], corners[:, 0] - corners[:, 2]))
+    a[a == 0] = 0.0001 # Don't want division by 0.
+    a1 = magnitudes(cross(f[:, 1], f[:, 2])) / a
+    a2 = magnitudes(cross(f[:, 2], f[:, 0])) / a
+    a3 = magnitudes(cross(f[:, 0], f[:, 1])) / a
+    return np.stack([a1, a2, a3], axis=1)
+
+# Triangles that were cut by clipping and are thinner than this (in game units) are left out of split segments.
+# Clipped points are truncated to whole numbers, which moves them by up to a unit, so pieces this thin are left over
+# from clipping. Triangles that clipping didn't change are only dropped if they have no area.
+MIN_TRIANGLE_HEIGHT = 0.5
+
+# Returns which of the triangles (a (T,3,3) array of corners) have no area, or are thinner than `minHeight` at their
+# thinnest point (the height over their longest side). `minHeight` can also be one value per triangle.
+def get_degenerate_triangles(corners, minHeight=MIN_TRIANGLE_HEIGHT):
+    corners = np.asarray(corners, dtype=np.float64)
+    doubleAreas = magnitudes(cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]))
+    longestSides = magnitudes((corners[:, [1, 2, 0]] - corners).reshape(-1, 3)).reshape(-1, 3).max(axis=1)
+    return (doubleAreas == 0) | (doubleAreas < minHeight * longestSides)
+
+# Adds up the values (an (N,3,...) array) of the corners of each point's triangle, using the weights from
+# calculate_barycentric_weights(). Done one corner at a time, like calculate_uv_for_point_in_triangle().
+def interpolate_corner_values(weights, values):
+    weights = weights.reshape(weights.shape + (1,) * (values.ndim - 2))
+    return values[:, 0] * weights[:, 0] + values[:, 1] * weights[:, 1] + values[:, 2] * weights[:, 2]
+
+# Adds the nodes of the split data to `nodes` in the order they go in the level binary, and returns the index of
+# `splitDataNode`.
+def get_bsp_nodes(splitDataNode, nodes):
+    nodeIndex = len(nodes)
+    nodes.append(None)
     leftIndex = rightIndex = -1
     if splitDataNode["left"] != None:
-        left, leftIndex = get_bsp_node(splitDataNode["left"], index)
+        leftIndex = get_bsp_nodes(splitDataNode["left"], nodes)
     if splitDataNode["right"] != None:
-        right, rightIndex = get_bsp_node(splitDataNode["right"], index)
-    splitAxis = splitDataNode["axis"]
+        rightIndex = get_bsp_nodes(splitDataNode["right"], nodes)
+    splitAxis = AXIS_TO_VALUE[splitDataNode["axis"].upper()]
     splitValue = splitDataNode["value"]
     segment = splitDataNode["segment"]
-    return (BspTreeNode(splitAxis, splitValue, segment, leftIndex, left, rightIndex, right), nodeIndex)
+    nodes[nodeIndex] = (splitAxis, splitValue, segment, leftIndex, rightIndex)
+    return nodeIndex
+
+# Sends the triangles down the split tree to every side of a split that they touch, and adds the triangles that reach
+# each leaf to `leafTriangles`. Leaves are in the same order as the segment bounding boxes from split_segment() and
+# split_segment_equally(). `margin` keeps triangles that are only just on the other side of a split.
+def route_triangles(splitDataNode, triMins, triMaxs, triIndices, leafTriangles, margin):
+    if splitDataNode == None:
+        leafTriangles.append(triIndices)
+        return
+    axisIndex = AXIS_TO_VALUE[splitDataNode["axis"].upper()]
+    splitValue = splitDataNode["value"]
+    goesLeft = triMins[triIndices, axisIndex] <= splitValue + margin
+    goesRight = triMaxs[triIndices, axisIndex] >= splitValue - margin
+    route_triangles(splitDataNode["left"], triMins, triMaxs, triIndices[goesLeft], leafTriangles, margin)
+    route_triangles(splitDataNode["right"], triMins, triMaxs, triIndices[goesRight], leafTriangles, margin)
+
+# Like route_triangles(), but for points, which only go to one side of each split. Points on a split go to the right,
+# the same as in BspTree.locate().
+def route_points(splitDataNode, points, pointIndices, leafPoints):
+    if splitDataNode == None:
+        leafPoints.append(pointIndices)
+        return
+    goesLeft = points[pointIndices, AXIS_TO_VALUE[splitDataNode["axis"].upper()]] < splitDataNode["value"]
+    route_points(splitDataNode["left"], points, pointIndices[goesLeft], leafPoints)
+    route_points(splitDataNode["right"], points, pointIndices[~goesLeft], leafPoints)
+
+# Returns how much of each triangle's bounding box is inside the segment box that it is paired with, from 0 to 1.
+# Axes that a triangle is flat on count as fully inside if the triangle is within the box on that axis.
+def get_box_overlaps(triMins, triMaxs, bbMins, bbMaxs):
+    lengths = np.minimum(triMaxs, bbMaxs) - np.maximum(triMins, bbMins)
+    extents = triMaxs - triMins
+    fractions = np.where(extents > 0, lengths / np.maximum(extents, 1), 1.0)
+    fractions[lengths < 0] = 0.0
+    return fractions.prod(axis=1)
+
+# Returns the leaf (segment) that each whole triangle goes to. With 'centroid', it's the leaf that the middle of the
+# triangle is in. With 'overlap', it's the one whose box has the most of the triangle's bounding box in it, out of the
+# ones the triangle reaches in route_triangles(). Ties go to the first of them.
+def assign_triangles(splitDataNode, triPositions, segmentBoundingBoxes, assign):
+    triIndices = np.arange(len(triPositions))
+    triangleLeaves = np.zeros(len(triPositions), dtype=np.int64)
+    leaves = []
+    if assign == 'centroid':
+        route_points(splitDataNode, triPositions.mean(axis=1), triIndices, leaves)
+        for leaf, leafTriangles in enumerate(leaves):
+            triangleLeaves[leafTriangles] = leaf
+        return triangleLeaves
+    triMins = triPositions.min(axis=1)
+    triMaxs = triPositions.max(axis=1)
+    route_triangles(splitDataNode, triMins, triMaxs, triIndices, leaves, 0)
+    pairLeaves = np.repeat(np.arange(len(leaves)), [len(leafTriangles) for leafTriangles in leaves])
+    pairTriangles = np.concatenate(leaves)
+    bbMins = np.array([bb.min for bb in segmentBoundingBoxes], dtype=np.int64).reshape(-1, 3)
+    bbMaxs = np.array([bb.max for bb in segmentBoundingBoxes], dtype=np.int64).reshape(-1, 3)
+    overlaps = get_box_overlaps(triMins[pairTriangles], triMaxs[pairTriangles], bbMins[pairLeaves], bbMaxs[pairLeaves])
+    # Sorted by triangle, then by most overlap, then by leaf, so the first pair of each triangle is the one to keep.
+    order = np.lexsort((pairLeaves, -overlaps, pairTriangles))
+    isFirst = np.ones(len(order), dtype=bool)
+    isFirst[1:] = pairTriangles[order[1:]] != pairTriangles[order[:-1]]
+    triangleLeaves[pairTriangles[order[isFirst]]] = pairLeaves[order[isFirst]]
+    return triangleLeaves
+
+# The triangles of the model as arrays, so they can be shared with other processes.
+def get_triangle_arrays(trianglesData):
+    return {
+        'positions': np.array([tri.verts for tri in trianglesData], dtype=np.float64).reshape(-1, 3, 3),
+        'uvs': np.array([[(uv.u, uv.v) for uv in (tri.tri.uv0, tri.tri.uv1, tri.tri.uv2)] for tri in trianglesData], dtype=np.float64).reshape(-1, 3, 2),
+        'texIndices': np.array([tri.batch.texIndex for tri in trianglesData], dtype=np.int64),
+        'batchFlags': np.array([tri.batch.flags for tri in trianglesData], dtype=np.int64),
+        'triFlags': np.array([tri.tri.flags for tri in trianglesData], dtype=np.int64),
+        'colors': np.array([tri.colors for tri in trianglesData], dtype=np.float64).reshape(-1, 3, 4),
+    }
+
+# Clips the `candidates` triangles to a segment's box, and adds the pieces to `segment`. The UVs of the new points
+# come from where they are on the original triangle, and so do their colors if `interpolateColors` is set (otherwise
+# they are white).
+def _build_segment(segment, triangles, candidates, bbMin, bbMax, interpolateColors=False):
+    clippedPoints, clippedOffsets = clip_triangles_AABB(triangles['positions'][candidates], bbMin, bbMax)
+    numPoints = np.diff(clippedOffsets)
+    # The triangle that each clipped point is on.
+    pointTriangles = np.repeat(candidates, numPoints)
+    weights = calculate_barycentric_weights(clippedPoints, triangles['positions'][pointTriangles])
+    pointUVs = interpolate_corner_values(weights, triangles['uvs'][pointTriangles])
+
+    # Each polygon with at least 3 points is split into a fan of triangles: (0, 1, 2), (0, 2, 3), ...
+    numFanTriangles = np.maximum(numPoints - 2, 0)
+    polygons = np.repeat(np.arange(len(candidates)), numFanTriangles)
+    fanIndices = np.arange(len(polygons)) - np.repeat(np.cumsum(numFanTriangles) - numFanTriangles, numFanTriangles)
+    firstPoints = clippedOffsets[polygons]
+    cornerPoints = np.stack([firstPoints, firstPoints + fanIndices + 1, firstPoints + fanIndices + 2], axis=1).reshape(-1)
+    triIndices = candidates[polygons]
+
+    # Same as the Vertex constructor.
+    positions = np.clip(np.trunc(clippedPoints[cornerPoints]), MIN_S16, MAX_S16)
+    if interpolateColors:
+        colors = np.clip(np.round(interpolate_corner_values(weights, triangles['colors'][pointTriangles])), 0, 255)[cornerPoints]
+    else:
+        colors = np.full((len(positions), 4), 255)
+    uvs = pointUVs[cornerPoints].reshape(-1, 3, 2)
+    # Slivers are dropped here, before the batches are made. Corners that ended up in the same place are welded by
+    # add_triangles(), since it shares vertices with the same position and color within a batch.
+    # A polygon was changed by clipping if it doesn't have 3 points, or if they aren't the corners of its triangle.
+    isChanged = numPoints != 3
+    isTriangle = ~isChanged
+    corners = np.clip(np.trunc(clippedPoints[np.repeat(isTriangle, numPoints)]), MIN_S16, MAX_S16).reshape(-1, 3, 3)
+    isChanged[isTriangle] = (corners != triangles['positions'][candidates[isTriangle]]).any(axis=(1, 2))
+    minHeights = np.where(isChanged[polygons], MIN_TRIANGLE_HEIGHT, 0)
+    keep = ~get_degenerate_triangles(positions.reshape(-1, 3, 3), minHeights)
+    positions = positions.reshape(-1, 3, 3)[keep].reshape(-1, 3)
+    colors = colors.reshape(-1, 3, 4)[keep].reshape(-1, 4)
+    triIndices = triIndices[keep]
+    if interpolateColors:
+        # Points made by clipping that end up in the same place after truncating can have slightly different colors,
+        # which would stop add_triangles() from sharing them. They take the color of the first corner in that place.
+        isNewPoint = ~(clippedPoints[:, None, :] == triangles['positions'][pointTriangles]).all(axis=2).any(axis=1)
+        isNewCorner = isNewPoint[cornerPoints.reshape(-1, 3)[keep].reshape(-1)]
+        firstCorners, places = np.unique(positions, axis=0, return_index=True, return_inverse=True)[1:]
+        colors[isNewCorner] = colors[firstCorners[places.reshape(-1)]][isNewCorner]
+    segment.add_triangles(triangles['texIndices'][triIndices], triangles['batchFlags'][triIndices], triangles['triFlags'][triIndices], positions, colors, np.arange(len(positions)).reshape(-1, 3), uvs[keep])
+
+# Adds the `triIndices` triangles to `segment` as they are, without clipping them. Only triangles without any area are
+# dropped, since the rest haven't been changed.
+def _build_segment_unclipped(segment, triangles, triIndices):
+    triIndices = triIndices[~get_degenerate_triangles(triangles['positions'][triIndices], 0)]
+    positions = np.clip(np.trunc(triangles['positions'][triIndices].reshape(-1, 3)), MIN_S16, MAX_S16)
+    colors = triangles['colors'][triIndices].reshape(-1, 4)
+    segment.add_triangles(triangles['texIndices'][triIndices], triangles['batchFlags'][triIndices], triangles['triFlags'][triIndices], positions, colors, np.arange(len(positions)).reshape(-1, 3), triangles['uvs'][triIndices])
+
+# Each worker process attaches to the shared triangle arrays once.
+_workerTriangles = None
+
+def _init_split_worker(handle):
+    global _workerTriangles
+    _workerTriangles = SharedArrays.attach(handle)
+
+def _build_segment_columns(task):
+    candidates, bbMin, bbMax, interpolateColors = task
+    segment = ColumnarModel3DSegment()
+    _build_segment(segment, _workerTriangles.arrays, candidates, bbMin, bbMax, interpolateColors)
+    return segment.get_columns()
+
+# Builds the segments in `jobs` worker processes. The triangles are put in shared memory, and each worker sends back
+# the columns of the segments it built.
+def _build_segments_in_parallel(triangles, leafTriangles, segmentBoundingBoxes, jobs, interpolateColors):
+    tasks = [(candidates, bb.min, bb.max, interpolateColors) for bb, candidates in zip(segmentBoundingBoxes, leafTriangles)]
+    sharedTriangles = SharedArrays(triangles)
+    segments = []
+    try:
+        with ProcessPoolExecutor(min(jobs, len(tasks)), initializer=_init_split_worker, initargs=(sharedTriangles.get_handle(),)) as pool:
+            # map() gives back the results in the same order as the tasks.
+            for columns in pool.map(_build_segment_columns, tasks):
+                segment = ColumnarModel3DSegment()
+                segment.set_columns(columns)
+                segments.append(segment)
+    finally:
+        sharedTriangles.close(unlink=True)
+    return segments
+
+SPLIT_ASSIGN_MODES = ['clip', 'centroid', 'overlap']
 
 # Returns a new version of the model that is split up into segments.
-def split_model(model, splitData, segmentBoundingBoxes):
-    trianglesData = _get_triangles_data(model)
+# `jobs` is the number of processes used to build the segments, or 0 to use one per CPU.
+# `assign` is 'clip' to clip the triangles to the box of each segment they are in, or 'centroid'/'overlap' to put
+# each whole triangle in just one segment (see assign_triangles()). Those segments' bounding boxes grow to fit their
+# triangles, since they are worked out from the vertices.
+# If `splitCachePath` is set, segments that were built from the same triangles and box before are loaded from that
+# split cache directory instead of being built again (see split_cache).
+def split_model(model, splitData, segmentBoundingBoxes, calculateBitfields=True, *, jobs=1, interpolateColors=False, assign='clip', splitCachePath=None):
+    triangles = get_triangle_arrays(get_triangles_data(model))
+    if assign != 'clip':
+        triangleLeaves = assign_triangles(splitData["root"], triangles['positions'], segmentBoundingBoxes, assign)
+        # Sorting keeps the triangles of each segment in the same order as in the model.
+        order = np.argsort(triangleLeaves, kind='stable')
+        leafOffsets = np.searchsorted(triangleLeaves[order], np.arange(len(segmentBoundingBoxes) + 1))
+        leafTriangles = [order[leafOffsets[leaf]:leafOffsets[leaf + 1]] for leaf in range(0, len(segmentBoundingBoxes))]
+    else:
+        # Only triangles that reach a segment's leaf of the split tree can end up in it, so the rest are never clipped
+        # against its box. The margin is bigger than PLANE_THICKNESS_EPSILON, since clipping keeps points within that
+        # of a plane.
+        triPositions = triangles['positions']
+        leafTriangles = []
+        route_triangles(splitData["root"], triPositions.min(axis=1), triPositions.max(axis=1), np.arange(len(triPositions)), leafTriangles, PLANE_THICKNESS_EPSILON * 2)
+    assert len(leafTriangles) == len(segmentBoundingBoxes)
+
+    segments = [None] * len(segmentBoundingBoxes)
+    splitCache = None
+    if splitCachePath != None:
+        splitCache = SplitCache(splitCachePath)
+        keys = [splitCache.get_key(triangles, candidates, bb.min, bb.max, assign, interpolateColors) for bb, candidates in zip(segmentBoundingBoxes, leafTriangles)]
+        segments = [splitCache.load_segment(key) for key in keys]
+    toBuild = [leaf for leaf in range(0, len(segments)) if segments[leaf] == None]
+
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if assign != 'clip':
+        for leaf in toBuild:
+            segments[leaf] = Model3DSegment()
+            _build_segment_unclipped(segments[leaf], triangles, leafTriangles[leaf])
+    elif jobs > 1 and len(toBuild) > 1:
+        builtSegments = _build_segments_in_parallel(triangles, [leafTriangles[leaf] for leaf in toBuild], [segmentBoundingBoxes[leaf] for leaf in toBuild], jobs, interpolateColors)
+        for leaf, segment in zip(toBuild, builtSegments):
+            segments[leaf] = segment
+    else:
+        for leaf in toBuild:
+            segments[leaf] = Model3DSegment()
+            _build_segment(segments[leaf], triangles, leafTriangles[leaf], segmentBoundingBoxes[leaf].min, segmentBoundingBoxes[leaf].max, interpolateColors)
+
+    if splitCache != None:
+        for leaf in toBuild:
+            splitCache.save_segment(keys[leaf], segments[leaf])
+        print('Reused ' + str(splitCache.numLoaded) + ' of ' + str(len(segments)) + ' segments from the split cache')
     newModel = Model3D()
     newModel.textures = model.textures
-    for bb in segmentBoundingBoxes:
-        newSegment = Model3DSegment()
-        for tri in trianglesData:
-            verts = clip_AABB(copy(tri.verts), bb.min, bb.max)
-            if len(verts) >= 3:
-                vert0 = Vertex(verts[0][0], verts[0][1], verts[0][2])
-                uv0 = calculate_uv_for_point_in_triangle(verts[0], tri.verts[0], tri.verts[1], tri.verts[2], tri.tri)
-                for i in range(0, len(verts) - 2):
-                    vert1 = Vertex(verts[i + 1][0], verts[i + 1][1], verts[i + 1][2])
-                    vert2 = Vertex(verts[i + 2][0], verts[i + 2][1], verts[i + 2][2])
-                    uv1 = calculate_uv_for_point_in_triangle(verts[i + 1], tri.verts[0], tri.verts[1], tri.verts[2], tri.tri)
-                    uv2 = calculate_uv_for_point_in_triangle(verts[i + 2], tri.verts[0], tri.verts[1], tri.verts[2], tri.tri)
-                    newSegment.add_triangle(tri.batch.texIndex, tri.batch.flags, tri.tri.flags, vert0, vert1, vert2, uv0, uv1, uv2)
-        newModel.segments.append(newSegment)
-    newModel.bspTree.rootNode = get_bsp_node(splitData["root"], [0])[0]
-    calculate_segment_bitfields(newModel)
+    newModel.segments = segments
+    return _set_split_bsp_tree(newModel, splitData, calculateBitfields)
+
+def _set_split_bsp_tree(newModel, splitData, calculateBitfields):
+    bspNodes = []
+    if splitData["root"] != None:
+        get_bsp_nodes(splitData["root"], bspNodes)
+    newModel.bspTree.set_nodes(*np.array(bspNodes, dtype=np.int64).reshape(-1, 5).T)
+    if calculateBitfields:
+        calculate_segment_bitfields(newModel)
     return newModel
 
-def auto_split_model(model, numberOfSegments):
+SPLIT_MODES = ['equal', 'cost']
+
+# Returns (splits, segmentBoundingBoxes) for splitting the model into `numberOfSegments` segments.
+# `splitMode` is either 'equal', which cuts the model in half recursively (alternating between X and Z), or 'cost',
+# which picks each split with split_cost.
+def get_auto_splits(model, numberOfSegments, splitMode='equal'):
     modelAABB = model.get_bounding_box()
     minX = modelAABB[0][0]
     minY = modelAABB[0][1]
@@ -196,10 +435,29 @@ def auto_split_model(model, numberOfSegments):
     maxZ = modelAABB[1][2]
     segmentBoundingBoxes = []
     splits = {}
-    splits["root"] = split_segment_equally(segmentBoundingBoxes, SegmentAABB(minX, minY, minZ, maxX, maxY, maxZ), numberOfSegments, [1])
-    return split_model(model, splits, segmentBoundingBoxes)
+    if splitMode == 'cost':
+        triangles = get_triangle_arrays(get_triangles_data(model))
+        triPositions = triangles['positions']
+        splits["root"] = get_cost_split_tree(triPositions.min(axis=1), triPositions.max(axis=1), triangles['texIndices'], modelAABB[0], modelAABB[1], numberOfSegments)
+        split_segment(segmentBoundingBoxes, SegmentAABB(minX, minY, minZ, maxX, maxY, maxZ), [1], splits["root"])
+    else:
+        splits["root"] = split_segment_equally(segmentBoundingBoxes, SegmentAABB(minX, minY, minZ, maxX, maxY, maxZ), numberOfSegments, [1])
+    return (splits, segmentBoundingBoxes)
+
+# The splits that were used are written to `saveSplitPath` if it is set, in the same format that
+# manually_split_model() reads.
+def auto_split_model(model, numberOfSegments, calculateBitfields=True, *, jobs=1, interpolateColors=False, splitMode='equal', saveSplitPath=None, assign='clip', splitCachePath=None):
+    splits, segmentBoundingBoxes = get_auto_splits(model, numberOfSegments, splitMode)
+    if saveSplitPath != None:
+        save_split_json(splits, saveSplitPath)
+    return split_model(model, splits, segmentBoundingBoxes, calculateBitfields, jobs=jobs, interpolateColors=interpolateColors, assign=assign, splitCachePath=splitCachePath)
 
-def manually_split_model(model, splitJsonPath):
+def save_split_json(splits, path):
+    # The split values can be NumPy integers.
+    open(path, 'w').write(json.dumps(splits, indent=4, default=int))
+
+# Returns (splits, segmentBoundingBoxes) for splitting the model by the tree in a split JSON file.
+def get_manual_splits(model, splitJsonPath):
     modelAABB = model.get_bounding_box()
     minX = modelAABB[0][0]
     minY = modelAABB[0][1]
@@ -210,7 +468,11 @@ def manually_split_model(model, splitJsonPath):
     segmentBoundingBoxes = []
     splits = json.loads(open(splitJsonPath, 'r').read())
     split_segment(segmentBoundingBoxes, SegmentAABB(minX, minY, minZ, maxX, maxY, maxZ), [1], splits["root"])
-    return split_model(model, splits, segmentBoundingBoxes)
+    return (splits, segmentBoundingBoxes)
+
+def manually_split_model(model, splitJsonPath, calculateBitfields=True, *, jobs=1, interpolateColors=False, assign='clip', splitCachePath=None):
+    splits, segmentBoundingBoxes = get_manual_splits(model, splitJsonPath)
+    return split_model(model, splits, segmentBoundingBoxes, calculateBitfields, jobs=jobs, interpolateColors=interpolateColors, assign=assign, splitCachePath=splitCachePath)
 
 
 # -------- Test -------- #
@@ -0,0 +1,48 @@
+from model import *
+import hashlib
+import numpy as np
+
+# Two textures with the same key look the same in-game. Vanilla textures are identified by their index, since their
+# pixels only come from the decomp (or are random temporary ones), while custom textures are compared by their pixels.
+def get_texture_key(texture):
+    key = (texture.width, texture.height, texture.format, texture.collisionType, texture.originalTexIndex)
+    if texture.originalTexIndex != -1:
+        return key
+    if texture.tex == None:
+        return key + (id(texture),) # Nothing to compare, so it's never a duplicate.
+    tex = texture.tex.convert('RGBA')
+    return key + (tex.size, hashlib.sha1(tex.tobytes()).hexdigest())
+
+# Removes every texture that isn't in `keep`, and returns the new index of each old texture.
+def _keep_textures(model, keep):
+    remap = np.cumsum(keep) - 1
+    model.textures = [texture for texture, isKept in zip(model.textures, keep) if isKept]
+    return remap
+
+def _remap_texture_indices(model, remap):
+    for segment in model.segments:
+        segment.remap_texture_indices(remap)
+
+# Merges textures that have the same key, keeping the first one of each. Returns the number of textures removed.
+def deduplicate_textures(model):
+    firstIndices = {}
+    remap = np.arange(len(model.textures), dtype=np.int64)
+    for i, texture in enumerate(model.textures):
+        remap[i] = firstIndices.setdefault(get_texture_key(texture), i)
+    keep = remap == np.arange(len(model.textures))
+    if keep.all():
+        return 0
+    remap = _keep_textures(model, keep)[remap]
+    _remap_texture_indices(model, remap)
+    return int((~keep).sum())
+
+# Removes textures that no batch uses. Returns the number of textures removed.
+def prune_unused_textures(model):
+    keep = np.zeros(len(model.textures), dtype=bool)
+    for segment in model.segments:
+        texIndices = segment.get_batch_texture_indices()
+        keep[texIndices[texIndices != -1]] = True
+    if keep.all():
+        return 0
+    _remap_texture_indices(model, _keep_textures(model, keep))
+    return int((~keep).sum())
@@ -3,6 +3,8 @@ from OpenGL.GL import *
 import glfw
 from PIL import Image
 import math
+import numpy as np
+from bvh import TriangleBVH
 
 # TODO: Switch from immediate rendering to using VBO + Shaders
 
@@ -136,6 +138,30 @@ def get_visible_segments_from_surrounding_position(renderModel, i, shotSize, x,
     visibleSegments = visibleSegments.union(get_visible_segments_from_position(renderModel, i, shotSize, x, y, z, x, y, z - 1))
     return visibleSegments
     
+# Height above the track that segments are looked at from, roughly where a racer's camera would be.
+SAMPLE_CAMERA_HEIGHT = 50
+
+# Returns the positions that the visible segments of a segment are sampled from: the middle of each side and corner
+# of its bounding box. Each one is put SAMPLE_CAMERA_HEIGHT above the highest floor of the segment under it, found by
+# casting a ray down from the top of the box that only hits the upper sides of triangles. Positions with no floor
+# under them stay at the middle height of the box.
+def get_sample_positions(segment):
+    x, y, z = segment.get_center()
+    sizeX, sizeY, sizeZ = segment.get_bounding_box_size()
+    halfSizeX = sizeX // 2
+    halfSizeZ = sizeZ // 2
+    positions = np.array([
+        (x + halfSizeX, y, z), (x - halfSizeX, y, z), (x, y, z + halfSizeZ), (x, y, z - halfSizeZ),
+        (x + halfSizeX, y, z + halfSizeZ), (x - halfSizeX, y, z + halfSizeZ), (x + halfSizeX, y, z - halfSizeZ), (x - halfSizeX, y, z - halfSizeZ)
+    ], dtype=np.float64)
+    origins = positions.copy()
+    origins[:, 1] = segment.get_bounding_box()[1][1] + 1
+    directions = np.tile([0.0, -1.0, 0.0], (len(positions), 1))
+    hitTriangles, hitDistances = TriangleBVH.from_segment(segment).ray_cast(origins, directions, cullBackFaces=True)
+    isHit = hitTriangles != -1
+    positions[isHit, 1] = origins[isHit, 1] - hitDistances[isHit] + SAMPLE_CAMERA_HEIGHT
+    return positions.tolist()
+
 def process_segment_bitfields(model, shotSize):
     renderModel = BitfieldGeneratorModel(model)
     init_gl(shotSize[0], shotSize[1])
@@ -143,21 +169,10 @@ def process_segment_bitfields(model, shotSize):
     numSegments = len(model.segments)
     model.bspTree.bitfields = []
     for i in range(0, len(model.segments)):
-        seg = model.segments[i]
-        x, y, z = seg.get_center()
-        sizeX, sizeY, sizeZ = seg.get_bounding_box_size()
-        halfSizeX = sizeX // 2
-        halfSizeZ = sizeZ // 2
         # This is SLOW! How do I speed this up? Multiprocessing just makes things slower.
         visibleSegments = set()
-        visibleSegments = visibleSegments.union(get_visible_segments_from_surrounding_position(renderModel, i, shotSize, x + halfSizeX, y, z))
-        visibleSegments = visibleSegments.union(get_visible_segments_from_surrounding_position(renderModel, i, shotSize, x - halfSizeX, y, z))
-        visibleSegments = visibleSegments.union(get_visible_segments_from_surrounding_position(renderModel, i, shotSize, x, y, z + halfSizeZ))
-        visibleSegments = visibleSegments.union(get_visible_segments_from_surrounding_position(renderModel, i, shotSize, x, y, z - halfSizeZ))
-        visibleSegments = visibleSegments.union(get_visible_segments_from_surrounding_position(renderModel, i, shotSize, x + halfSizeX, y, z + halfSizeZ))
-        visibleSegments = visibleSegments.union(get_visible_segments_from_surrounding_position(renderModel, i, shotSize, x - halfSizeX, y, z + halfSizeZ))
-        visibleSegments = visibleSegments.union(get_visible_segments_from_surrounding_position(renderModel, i, shotSize, x + halfSizeX, y, z - halfSizeZ))
-        visibleSegments = visibleSegments.union(get_visible_segments_from_surrounding_position(renderModel, i, shotSize, x - halfSizeX, y, z - halfSizeZ))
+        for x, y, z in get_sample_positions(model.segments[i]):
+            visibleSegments = visibleSegments.union(get_visible_segments_from_surrounding_position(renderModel, i, shotSize, x, y, z))
         model.bspTree.bitfields.append(construct_bitfield_from_visible_segments(list(visibleSegments), numSegments))
         
 
@@ -0,0 +1,41 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+SHARED_ARRAY_ALIGNMENT = 64
+
+# A set of NumPy arrays stored one after another in a single block of shared memory, so worker processes can use
+# them without each getting a copy. The process that makes it has to call `close(unlink=True)` when done.
+class SharedArrays:
+    def __init__(self, arrays):
+        self.layout = []
+        size = 0
+        for name in arrays:
+            array = np.ascontiguousarray(arrays[name])
+            self.layout.append((name, array.dtype.str, array.shape, size))
+            size += -(-array.nbytes // SHARED_ARRAY_ALIGNMENT) * SHARED_ARRAY_ALIGNMENT
+        self._memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.arrays = self._get_arrays()
+        for name in arrays:
+            self.arrays[name][...] = arrays[name]
+
+    def _get_arrays(self):
+        return { name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=self._memory.buf, offset=offset) for name, dtype, shape, offset in self.layout }
+
+    # Everything another process needs to call attach().
+    def get_handle(self):
+        return (self._memory.name, self.layout)
+
+    @staticmethod
+    def attach(handle):
+        name, layout = handle
+        sharedArrays = SharedArrays.__new__(SharedArrays)
+        sharedArrays.layout = layout
+        sharedArrays._memory = shared_memory.SharedMemory(name=name)
+        sharedArrays.arrays = sharedArrays._get_arrays()
+        return sharedArrays
+
+    def close(self, unlink=False):
+        self.arrays = None
+        self._memory.close()
+        if unlink:
+            self._memory.unlink()
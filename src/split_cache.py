@@ -0,0 +1,47 @@
+from model import *
+from model_columnar import ColumnarModel3DSegment, to_columnar
+import hashlib
+import os
+import numpy as np
+
+# A directory of segments built by split_model(), so that splitting the same model again only builds the segments
+# that changed. Each segment is saved as a .splitseg.npz file with its columns, named after a hash of everything it
+# was built from: the triangles that reached its leaf of the split tree, its bounding box, and the split options.
+# Changing a split only changes the boxes and triangles of the leaves under it, so every other segment is loaded from
+# here. Segments are never removed, so that splits with other options or of other models can share the directory;
+# delete it to clear the cache.
+
+SPLIT_CACHE_VERSION = 2
+SPLIT_CACHE_EXTENSION = '.splitseg.npz'
+
+class SplitCache:
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.numLoaded = 0
+
+    # `triangles` are the arrays from get_triangle_arrays(), and `triIndices` are the ones the segment is built from.
+    def get_key(self, triangles, triIndices, bbMin, bbMax, assign, interpolateColors):
+        fingerprint = hashlib.sha1()
+        options = (SPLIT_CACHE_VERSION, assign, bool(interpolateColors), [int(value) for value in bbMin], [int(value) for value in bbMax])
+        fingerprint.update(repr(options).encode())
+        for name in sorted(triangles):
+            fingerprint.update(np.ascontiguousarray(triangles[name][triIndices]).tobytes())
+        return fingerprint.hexdigest()
+
+    def _get_path(self, key):
+        return os.path.join(self.path, key + SPLIT_CACHE_EXTENSION)
+
+    # Returns the segment saved under `key`, or None if there isn't one.
+    def load_segment(self, key):
+        if not os.path.isfile(self._get_path(key)):
+            return None
+        with np.load(self._get_path(key), allow_pickle=False) as columns:
+            segment = ColumnarModel3DSegment()
+            segment.set_columns({ name: columns[name] for name in columns.files })
+        self.numLoaded += 1
+        return segment
+
+    def save_segment(self, key, segment):
+        with open(self._get_path(key), 'wb') as outFile:
+            np.savez(outFile, **to_columnar(segment).get_columns())
@@ -0,0 +1,114 @@
+import numpy as np
+from model import MAX_NUM_TRIS_PER_BATCH
+
+# Picks the split tree for auto splitting by trying a number of split planes on each axis and keeping the cheapest.
+# The cost of a split is made up of:
+#   balance: how different the number of triangles per segment is on each side.
+#   cut:     how many triangles cross the plane, since those get clipped into more triangles.
+#   batches: how many more batches the two sides need than the triangles did together.
+# Each part is relative, so the weights say how much they matter compared to each other.
+
+SPLIT_COST_BALANCE_WEIGHT = 1.0
+SPLIT_COST_CUT_WEIGHT = 2.0
+SPLIT_COST_BATCHES_WEIGHT = 0.5
+SPLIT_COST_WEIGHTS = (SPLIT_COST_BALANCE_WEIGHT, SPLIT_COST_CUT_WEIGHT, SPLIT_COST_BATCHES_WEIGHT)
+NUM_SPLIT_CANDIDATES = 32
+
+SPLIT_AXIS_NAMES = ['X', 'Y', 'Z']
+
+# Returns how many of the ranges from `mins` to `maxs` go to the left and right of each of the split values, the same
+# way get_split_sides() sorts triangles, so the costs count the same triangles on each side as the split does. Ranges
+# that start before a value go left and ones that end after it go right, and get_split_sides() also sends ranges that
+# are flat on the value (start and end at it) to both sides.
+def _count_sides(mins, maxs, values):
+    flatValues = np.sort(mins[mins == maxs])
+    numFlat = np.searchsorted(flatValues, values, side='right') - np.searchsorted(flatValues, values, side='left')
+    numLeft = np.searchsorted(np.sort(mins), values, side='left') + numFlat
+    numRight = len(maxs) - np.searchsorted(np.sort(maxs), values, side='right') + numFlat
+    return (numLeft, numRight)
+
+def estimate_batches(numTextures, numTriangles):
+    return numTextures + numTriangles / MAX_NUM_TRIS_PER_BATCH
+
+# Returns the split values to try along one axis of the box: quantiles of where the triangles start and end (since
+# a plane there can go between triangles instead of through them), and the middle of the box. Values are whole
+# numbers strictly inside the box.
+def _get_candidate_values(edges, boxMin, boxMax):
+    if boxMax - boxMin < 2:
+        return np.zeros(0, dtype=np.int64)
+    values = [(boxMin + boxMax) // 2]
+    if len(edges) > 0:
+        values += np.round(np.quantile(edges, np.arange(1, NUM_SPLIT_CANDIDATES) / NUM_SPLIT_CANDIDATES)).tolist()
+    return np.unique(np.clip(np.array(values, dtype=np.int64), boxMin + 1, boxMax - 1))
+
+# Returns (cost, axis, value) of the cheapest split of the triangles into `numLeft` and `numRight` segments, or None
+# if the box can't be split. If `rng` is set, each cost is multiplied by a random amount up to `1 + noise`, so that
+# splits that cost about the same get picked some of the time.
+def _find_best_split(triMins, triMaxs, texIndices, boxMin, boxMax, numLeft, numRight, weights=SPLIT_COST_WEIGHTS, rng=None, noise=0.0):
+    numTriangles = len(triMins)
+    numSegments = numLeft + numRight
+    textures, textureIds = np.unique(texIndices, return_inverse=True)
+    totalBatches = max(estimate_batches(len(textures), numTriangles), 1.0)
+    best = None
+    for axis in range(0, 3):
+        values = _get_candidate_values(np.concatenate([triMins[:, axis], triMaxs[:, axis]]), int(boxMin[axis]), int(boxMax[axis]))
+        if len(values) == 0:
+            continue
+        leftTris, rightTris = _count_sides(triMins[:, axis], triMaxs[:, axis], values)
+        # Each texture is on a side if any of its triangles are.
+        texMins = np.full(len(textures), np.inf)
+        texMaxs = np.full(len(textures), -np.inf)
+        np.minimum.at(texMins, textureIds, triMins[:, axis])
+        np.maximum.at(texMaxs, textureIds, triMaxs[:, axis])
+        leftTextures, rightTextures = _count_sides(texMins, texMaxs, values)
+
+        perSegment = max(numTriangles / numSegments, 1.0)
+        balance = np.abs(leftTris / numLeft - rightTris / numRight) / perSegment
+        cut = (leftTris + rightTris - numTriangles) / max(numTriangles, 1)
+        batches = (estimate_batches(leftTextures, leftTris) + estimate_batches(rightTextures, rightTris) - totalBatches) / totalBatches
+        costs = weights[0] * balance + weights[1] * cut + weights[2] * batches
+        if rng != None:
+            costs = costs * rng.uniform(1.0, 1.0 + noise, len(costs))
+        # A side without any triangles is a wasted segment, unless there is nothing to split.
+        if numTriangles > 0:
+            costs[(leftTris == 0) | (rightTris == 0)] = np.inf
+        i = int(np.argmin(costs))
+        if costs[i] != np.inf and (best == None or costs[i] < best[0]):
+            best = (float(costs[i]), axis, int(values[i]))
+    return best
+
+# Returns which of the triangles go to the left and right side of a split. Triangles that are flat on the plane go to
+# both sides.
+def get_split_sides(triMins, triMaxs, axis, value):
+    goesLeft = (triMins[:, axis] < value) | (triMaxs[:, axis] <= value)
+    goesRight = (triMaxs[:, axis] > value) | (triMins[:, axis] >= value)
+    return (goesLeft, goesRight)
+
+# Returns a split tree, in the same format as a manual split JSON file, that splits the box into `numSegments`
+# segments. `triMins` and `triMaxs` are (T,3) arrays with the bounds of each triangle, and `texIndices` has the
+# texture of each triangle. `weights` are the weights of the balance, cut and batches costs.
+# If `rng` (a NumPy Generator) is set, the tree is randomized: the split costs get some noise (see _find_best_split())
+# and the segments aren't always shared out evenly between the two sides of a split.
+def get_cost_split_tree(triMins, triMaxs, texIndices, boxMin, boxMax, numSegments, weights=SPLIT_COST_WEIGHTS, rng=None, noise=0.0):
+    if numSegments <= 1:
+        return None
+    numRight = numSegments // 2
+    if rng != None and numSegments >= 3:
+        numRight = int(rng.integers(max(numRight - 1, 1), min(numRight + 1, numSegments - 1) + 1))
+    numLeft = numSegments - numRight
+    best = _find_best_split(triMins, triMaxs, texIndices, boxMin, boxMax, numLeft, numRight, weights, rng, noise)
+    if best == None:
+        # Too small to split, so give up on the rest of the segments here.
+        return None
+    cost, axis, value = best
+    leftMax = np.array(boxMax, dtype=np.int64)
+    leftMax[axis] = value
+    rightMin = np.array(boxMin, dtype=np.int64)
+    rightMin[axis] = value
+    goesLeft, goesRight = get_split_sides(triMins, triMaxs, axis, value)
+    return {
+        "axis": SPLIT_AXIS_NAMES[axis],
+        "value": value,
+        "left": get_cost_split_tree(triMins[goesLeft], triMaxs[goesLeft], texIndices[goesLeft], boxMin, leftMax, numLeft, weights, rng, noise),
+        "right": get_cost_split_tree(triMins[goesRight], triMaxs[goesRight], texIndices[goesRight], rightMin, boxMax, numRight, weights, rng, noise),
+    }
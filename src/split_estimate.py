@@ -0,0 +1,144 @@
+from model import *
+import json
+import numpy as np
+from split_cost import get_split_sides
+from model_split import AXIS_TO_VALUE, get_bsp_nodes, assign_triangles
+from export_dkr_level_binary import LevelBinaryLayout
+from level_budget import get_layout_problems, check_layout_problems
+
+# Estimates what splitting a model would give, without clipping any triangles or building any segments. Triangles
+# are sent down the split tree by their bounding boxes, and each triangle that crosses the box of its segment is
+# counted as a number of clipped pieces. The numbers of vertices and batches come from the runs of triangles with the
+# same texture and flags in each segment, and the size of the level binary from those counts.
+
+# Average number of triangles and new vertices that clipping makes from a triangle crossing the edge of a segment.
+CLIPPED_TRIANGLE_PIECES = 1.5
+CLIPPED_TRIANGLE_VERTICES = 2.0
+
+# Returns (positions, colors, texIndices, batchFlags) of every triangle in the model, in the same order as
+# split_model() goes through them.
+def _get_model_triangles(model):
+    positions = [np.zeros((0, 3, 3), dtype=np.int64)]
+    colors = [np.zeros((0, 3, 4), dtype=np.int64)]
+    texIndices = [np.zeros(0, dtype=np.int64)]
+    batchFlags = [np.zeros(0, dtype=np.int64)]
+    for segment in model.segments:
+        batchIndices = segment.get_triangle_batch_indices()
+        positions.append(segment.get_triangle_positions())
+        vertexColors = np.array([(vert.color.r, vert.color.g, vert.color.b, vert.color.a) for vert in segment.vertices], dtype=np.int64).reshape(-1, 4)
+        colors.append(vertexColors[segment.get_triangle_vertex_indices()])
+        texIndices.append(segment.get_batch_texture_indices()[batchIndices])
+        batchFlags.append(np.array([batch.flags for batch in segment.batches], dtype=np.int64)[batchIndices])
+    return (np.concatenate(positions).astype(np.int64), np.concatenate(colors), np.concatenate(texIndices), np.concatenate(batchFlags))
+
+# Sends the triangles down the split tree like route_triangles(), but triangles that only touch a split from one side
+# don't go to the other. Adds (axis, value, numTriangles, numCut) for each split to `splitCounts`, in the same order
+# as get_bsp_nodes().
+def _route_triangles(splitDataNode, triMins, triMaxs, triIndices, leafTriangles, splitCounts):
+    if splitDataNode == None:
+        leafTriangles.append(triIndices)
+        return
+    axis = AXIS_TO_VALUE[splitDataNode["axis"].upper()]
+    value = splitDataNode["value"]
+    goesLeft, goesRight = get_split_sides(triMins[triIndices], triMaxs[triIndices], axis, value)
+    isCut = (triMins[triIndices, axis] < value) & (triMaxs[triIndices, axis] > value)
+    splitCounts.append((splitDataNode["axis"].upper(), int(value), len(triIndices), int(isCut.sum())))
+    _route_triangles(splitDataNode["left"], triMins, triMaxs, triIndices[goesLeft], leafTriangles, splitCounts)
+    _route_triangles(splitDataNode["right"], triMins, triMaxs, triIndices[goesRight], leafTriangles, splitCounts)
+
+# Returns the estimated (numTriangles, numVertices, numBatches) of each segment. `leafTriangles` has the triangles of
+# each segment, and `isClipped` says which of them (for every entry of `leafTriangles`, in order) get clipped.
+# `corners` has the vertex of each corner of each triangle, which is shared with other corners that are the same.
+def _estimate_segment_counts(corners, texIndices, batchFlags, leafTriangles, isClipped):
+    numSegments = len(leafTriangles)
+    triIndices = np.concatenate(leafTriangles).astype(np.int64)
+    segmentIndices = np.repeat(np.arange(numSegments), [len(leaf) for leaf in leafTriangles])
+    # A run is a group of triangles in a row that are in the same segment, with the same texture and flags, so that
+    # add_triangles() would put them in the same batches.
+    isRunStart = np.ones(len(triIndices), dtype=bool)
+    isRunStart[1:] = (segmentIndices[1:] != segmentIndices[:-1]) | (texIndices[triIndices[1:]] != texIndices[triIndices[:-1]]) | (batchFlags[triIndices[1:]] != batchFlags[triIndices[:-1]])
+    runIndices = np.cumsum(isRunStart) - 1
+    # Each run is cut into batches of MAX_NUM_TRIS_PER_BATCH triangles, since vertices are only shared within a batch.
+    pieces = np.where(isClipped, CLIPPED_TRIANGLE_PIECES, 1.0)
+    piecesBefore = np.cumsum(pieces) - pieces
+    runPiecesBefore = piecesBefore - piecesBefore[isRunStart][runIndices]
+    isBatchStart = isRunStart.copy()
+    isBatchStart[1:] |= (runPiecesBefore[1:] // MAX_NUM_TRIS_PER_BATCH) != (runPiecesBefore[:-1] // MAX_NUM_TRIS_PER_BATCH)
+    batchIndices = np.cumsum(isBatchStart) - 1
+    numBatches = int(isBatchStart.sum())
+    batchSegments = segmentIndices[isBatchStart]
+
+    # Corners of triangles that aren't clipped are shared if they are in the same place, while clipped triangles are
+    # counted as adding new vertices.
+    unclipped = ~isClipped
+    cornerBatches = np.repeat(batchIndices[unclipped], 3)
+    uniqueCorners = np.unique(np.column_stack([cornerBatches, corners[triIndices[unclipped]].reshape(len(cornerBatches), -1)]), axis=0)
+    batchTriangles = np.bincount(batchIndices, weights=pieces, minlength=numBatches)
+    batchVertices = np.bincount(uniqueCorners[:, 0], minlength=numBatches) + np.bincount(batchIndices, weights=isClipped * CLIPPED_TRIANGLE_VERTICES, minlength=numBatches)
+    # Batches with too many vertices get split up again.
+    batchCounts = np.maximum(np.ceil(batchVertices / MAX_NUM_VERTS_PER_BATCH), 1)
+
+    numTriangles = np.round(np.bincount(batchSegments, weights=batchTriangles, minlength=numSegments)).astype(np.int64)
+    numVertices = np.round(np.bincount(batchSegments, weights=batchVertices, minlength=numSegments)).astype(np.int64)
+    numBatches = np.bincount(batchSegments, weights=batchCounts, minlength=numSegments).astype(np.int64)
+    return (numTriangles, numVertices, numBatches)
+
+# Returns a JSON-friendly report of what split_model() would give for these splits.
+def estimate_split(model, splits, segmentBoundingBoxes, assign='clip', interpolateColors=False):
+    positions, colors, texIndices, batchFlags = _get_model_triangles(model)
+    triMins = positions.min(axis=1)
+    triMaxs = positions.max(axis=1)
+    bbMins = np.array([bb.min for bb in segmentBoundingBoxes], dtype=np.int64).reshape(-1, 3)
+    bbMaxs = np.array([bb.max for bb in segmentBoundingBoxes], dtype=np.int64).reshape(-1, 3)
+    leafTriangles = []
+    splitCounts = []
+    _route_triangles(splits["root"], triMins, triMaxs, np.arange(len(positions)), leafTriangles, splitCounts)
+    if assign == 'clip':
+        # A triangle is clipped if it goes outside of its segment's box.
+        segmentIndices = np.repeat(np.arange(len(leafTriangles)), [len(leaf) for leaf in leafTriangles])
+        triIndices = np.concatenate(leafTriangles).astype(np.int64)
+        isClipped = ((triMins[triIndices] < bbMins[segmentIndices]) | (triMaxs[triIndices] > bbMaxs[segmentIndices])).any(axis=1)
+    else:
+        triangleLeaves = assign_triangles(splits["root"], positions, segmentBoundingBoxes, assign)
+        leafTriangles = [np.flatnonzero(triangleLeaves == leaf) for leaf in range(0, len(segmentBoundingBoxes))]
+        isClipped = np.zeros(len(positions), dtype=bool)
+    # Triangles that aren't clipped keep their colors, unless clipping turns them white.
+    corners = positions
+    if assign != 'clip' or interpolateColors:
+        corners = np.concatenate([positions, colors], axis=2)
+    numTriangles, numVertices, numBatches = _estimate_segment_counts(corners, texIndices, batchFlags, leafTriangles, isClipped)
+
+    segmentCounts = list(zip(numVertices.tolist(), numTriangles.tolist(), numBatches.tolist()))
+    layout = LevelBinaryLayout(len(model.textures), segmentCounts, len(segmentCounts) > 1)
+    bspNodes = []
+    if splits["root"] != None:
+        get_bsp_nodes(splits["root"], bspNodes)
+    return {
+        'assign': assign,
+        'numSegments': len(segmentCounts),
+        'numTriangles': int(numTriangles.sum()),
+        'numVertices': int(numVertices.sum()),
+        'numBatches': int(numBatches.sum()),
+        'numCutTriangles': sum([counts[3] for counts in splitCounts]),
+        'fileSize': layout.fileSize,
+        'splits': [{ 'axis': axis, 'value': value, 'segment': int(node[2]), 'numTriangles': numTris, 'numCutTriangles': numCut }
+            for (axis, value, numTris, numCut), node in zip(splitCounts, bspNodes)],
+        'segments': [{ 'index': i, 'numTriangles': tris, 'numClippedTriangles': int(isClippedInSegment), 'numVertices': verts, 'numBatches': batches }
+            for i, ((verts, tris, batches), isClippedInSegment) in enumerate(zip(segmentCounts, _count_per_segment(isClipped, leafTriangles)))],
+        'problems': get_layout_problems(layout),
+    }
+
+def _count_per_segment(values, leafTriangles):
+    offsets = np.cumsum([0] + [len(leaf) for leaf in leafTriangles])
+    return [values[offsets[i]:offsets[i + 1]].sum() for i in range(0, len(leafTriangles))]
+
+def estimate_split_model(model, splits, segmentBoundingBoxes, args):
+    report = estimate_split(model, splits, segmentBoundingBoxes, args.assign, args.interpolatecolors)
+    reportText = json.dumps(report, indent=4)
+    if args.output != None:
+        open(args.output, 'w').write(reportText + '\n')
+    else:
+        print(reportText)
+    check_layout_problems(report['problems'])
+    if args.maxsize != None and report['fileSize'] > args.maxsize:
+        raise SystemExit('Error: The level binary would be about ' + str(report['fileSize']) + ' bytes, which is over the budget of ' + str(args.maxsize) + ' bytes.')
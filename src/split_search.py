@@ -0,0 +1,138 @@
+import numpy as np
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from shared_arrays import SharedArrays
+from split_cost import SPLIT_COST_WEIGHTS, get_cost_split_tree, get_split_sides, estimate_batches
+from model_split import AXIS_TO_VALUE, SegmentAABB, split_segment_equally, save_split_json, get_triangle_arrays, get_triangles_data
+
+# Tries out a number of split trees for a model without building any segments, and writes the best ones as split
+# JSON files that can be used with --manualsplit. Each tree is scored with the same cheap estimates that split_cost
+# uses for a single split, but for the whole tree:
+#   balance: how much bigger the largest segment is than the average one.
+#   cut:     how many more triangles there are in the segments than in the model, from clipping.
+#   batches: how many more batches the segments need than the model did in one segment.
+# Lower scores are better.
+#
+# The first candidate is the tree from --splitmode equal, and the second is the one from --splitmode cost. The rest
+# are cost trees with random weights, noise and numbers of segments on each side, so they are different from (but
+# near to) the cost tree.
+
+SPLIT_SEARCH_SEED = 0
+SPLIT_SEARCH_NOISE = 0.5
+SPLIT_SEARCH_WEIGHT_RANGE = 4.0 # Each random weight is between the default divided and multiplied by this.
+SPLIT_SEARCH_REPORT_NAME = 'report.json'
+
+# Returns the number of triangles and textures in each segment of the split tree, in the same order as the segments.
+def _get_leaf_counts(node, triMins, triMaxs, texIndices, counts):
+    if node == None:
+        counts.append((len(texIndices), len(np.unique(texIndices))))
+        return counts
+    goesLeft, goesRight = get_split_sides(triMins, triMaxs, AXIS_TO_VALUE[node["axis"].upper()], node["value"])
+    _get_leaf_counts(node["left"], triMins[goesLeft], triMaxs[goesLeft], texIndices[goesLeft], counts)
+    _get_leaf_counts(node["right"], triMins[goesRight], triMaxs[goesRight], texIndices[goesRight], counts)
+    return counts
+
+# Returns the score of a split tree, and the numbers it came from.
+def score_split_tree(tree, triMins, triMaxs, texIndices, weights=SPLIT_COST_WEIGHTS):
+    counts = np.array(_get_leaf_counts(tree, triMins, triMaxs, texIndices, []), dtype=np.int64)
+    numTriangles = len(texIndices)
+    segmentTriangles = counts[:, 0]
+    totalTriangles = int(segmentTriangles.sum())
+    segmentBatches = np.ceil(estimate_batches(counts[:, 1], segmentTriangles))
+    modelBatches = max(np.ceil(estimate_batches(len(np.unique(texIndices)), numTriangles)), 1.0)
+    balance = segmentTriangles.max() / max(totalTriangles / len(counts), 1.0) - 1.0
+    cut = (totalTriangles - numTriangles) / max(numTriangles, 1)
+    batches = (segmentBatches.sum() - modelBatches) / modelBatches
+    score = weights[0] * balance + weights[1] * cut + weights[2] * batches
+    return {
+        'score': round(float(score), 6),
+        'numSegments': len(counts),
+        'minTriangles': int(segmentTriangles.min()),
+        'maxTriangles': int(segmentTriangles.max()),
+        'totalTriangles': totalTriangles,
+        'cutTriangles': totalTriangles - numTriangles,
+        'estimatedBatches': int(segmentBatches.sum()),
+    }
+
+# Makes and scores one candidate tree. Each candidate has its own random numbers, so the results are the same no
+# matter which process they are made in.
+def _evaluate_candidate(triangles, box, numSegments, candidate):
+    triMins, triMaxs, texIndices = triangles['triMins'], triangles['triMaxs'], triangles['texIndices']
+    weights = SPLIT_COST_WEIGHTS
+    if candidate == 0:
+        boxMin, boxMax = box.tolist()
+        tree = split_segment_equally([], SegmentAABB(*boxMin, *boxMax), numSegments, [1])
+    elif candidate == 1:
+        tree = get_cost_split_tree(triMins, triMaxs, texIndices, box[0], box[1], numSegments)
+    else:
+        rng = np.random.default_rng([SPLIT_SEARCH_SEED, candidate])
+        weights = tuple(float(weight) for weight in np.array(SPLIT_COST_WEIGHTS) * SPLIT_SEARCH_WEIGHT_RANGE ** rng.uniform(-1.0, 1.0, 3))
+        tree = get_cost_split_tree(triMins, triMaxs, texIndices, box[0], box[1], numSegments, weights, rng, SPLIT_SEARCH_NOISE)
+    # Every tree is scored with the default weights, so the scores can be compared.
+    result = score_split_tree(tree, triMins, triMaxs, texIndices)
+    result['candidate'] = candidate
+    result['weights'] = [round(weight, 4) for weight in weights]
+    return (result, tree)
+
+# Each worker process attaches to the shared triangle bounds once.
+_workerTriangles = None
+_workerArgs = None
+
+def _init_search_worker(handle, box, numSegments):
+    global _workerTriangles, _workerArgs
+    _workerTriangles = SharedArrays.attach(handle)
+    _workerArgs = (box, numSegments)
+
+def _evaluate_candidate_in_worker(candidate):
+    return _evaluate_candidate(_workerTriangles.arrays, *_workerArgs, candidate)
+
+def _evaluate_candidates(triangles, box, numSegments, numCandidates, jobs):
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if jobs <= 1 or numCandidates <= 1:
+        return [_evaluate_candidate(triangles, box, numSegments, candidate) for candidate in range(0, numCandidates)]
+    sharedTriangles = SharedArrays(triangles)
+    try:
+        with ProcessPoolExecutor(min(jobs, numCandidates), initializer=_init_search_worker, initargs=(sharedTriangles.get_handle(), box, numSegments)) as pool:
+            return list(pool.map(_evaluate_candidate_in_worker, range(0, numCandidates)))
+    finally:
+        sharedTriangles.close(unlink=True)
+
+def _get_tree_key(node):
+    if node == None:
+        return None
+    return (node["axis"].upper(), int(node["value"]), _get_tree_key(node["left"]), _get_tree_key(node["right"]))
+
+# Scores `args.searchcandidates` split trees that split the model into `args.searchsplit` segments, and writes the
+# best `args.searchtop` of them to the output directory, along with a report of every tree that was tried.
+def search_split_trees(model, args):
+    triangles = get_triangle_arrays(get_triangles_data(model))
+    triPositions = triangles['positions']
+    searchTriangles = { 'triMins': triPositions.min(axis=1), 'triMaxs': triPositions.max(axis=1), 'texIndices': triangles['texIndices'] }
+    box = np.array(model.get_bounding_box(), dtype=np.int64)
+    results = _evaluate_candidates(searchTriangles, box, args.searchsplit, args.searchcandidates, args.jobs)
+
+    # Different candidates can end up with the same tree, so only the first of them is kept.
+    uniqueResults = {}
+    for result, tree in results:
+        uniqueResults.setdefault(_get_tree_key(tree), (result, tree))
+    # Sorting by candidate too keeps the order the same when scores are tied.
+    ranked = sorted(uniqueResults.values(), key=lambda resultAndTree: (resultAndTree[0]['score'], resultAndTree[0]['candidate']))
+
+    os.makedirs(args.output, exist_ok=True)
+    report = []
+    for rank, (result, tree) in enumerate(ranked, 1):
+        entry = { 'rank': rank, 'file': None }
+        entry.update(result)
+        if rank <= args.searchtop:
+            entry['file'] = 'split_' + str(rank) + '.json'
+            save_split_json({ "root": tree }, os.path.join(args.output, entry['file']))
+        report.append(entry)
+    open(os.path.join(args.output, SPLIT_SEARCH_REPORT_NAME), 'w').write(json.dumps(report, indent=4) + '\n')
+
+    print('Tried ' + str(len(results)) + ' split trees (' + str(len(ranked)) + ' different)')
+    for entry in report[:args.searchtop]:
+        print(str(entry['rank']) + '. ' + entry['file'] + ': score ' + str(entry['score']) + ', ' + str(entry['numSegments']) + ' segments, '
+            + str(entry['minTriangles']) + '-' + str(entry['maxTriangles']) + ' triangles per segment, ' + str(entry['cutTriangles'])
+            + ' cut triangles, ~' + str(entry['estimatedBatches']) + ' batches')
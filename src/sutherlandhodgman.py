@@ -65,3 +65,38 @@ def clip_AABP(p_vs, s, a, c_v):
 def _safe_append(new_p_vs, p_v):
     if (len(new_p_vs) == 0) or (not np.array_equal(new_p_vs[-1], p_v)):
         new_p_vs.append(p_v)
+
+# Clips every triangle in `triangles` (an (N,3,3) array) against an AABB, giving the same polygons as clip_AABB().
+# Returns (points, offsets), where the points of polygon `i` are points[offsets[i]:offsets[i + 1]]. Triangles that
+# are clipped away have no points.
+# Triangles that are fully inside or fully outside the box are found up front, so only the ones that cross one of
+# its planes are clipped one at a time.
+def clip_triangles_AABB(triangles, pMin, pMax):
+    triangles = np.asarray(triangles, dtype=np.float64).reshape(-1, 3, 3)
+    pMin = np.asarray(pMin, dtype=np.float64)
+    pMax = np.asarray(pMax, dtype=np.float64)
+    # Same as classify_aligned() returning -1, for each corner and axis.
+    belowMin = 1.0 * (triangles - pMin) < -PLANE_THICKNESS_EPSILON
+    aboveMax = -1.0 * (triangles - pMax) < -PLANE_THICKNESS_EPSILON
+    isOutside = belowMin.all(axis=1).any(axis=1) | aboveMax.all(axis=1).any(axis=1)
+    # clip_AABP() removes repeated corners, so only triangles with 3 different corners come out unchanged.
+    hasRepeatedCorners = np.zeros(len(triangles), dtype=bool)
+    for a, b in [(0, 1), (1, 2), (2, 0)]:
+        hasRepeatedCorners |= (triangles[:, a] == triangles[:, b]).all(axis=1)
+    isInside = ~(belowMin | aboveMax).any(axis=(1, 2)) & ~hasRepeatedCorners
+
+    polygons = {}
+    for i in np.flatnonzero(~isInside & ~isOutside).tolist():
+        polygons[i] = np.array(clip_AABB(triangles[i], pMin, pMax), dtype=np.float64).reshape(-1, 3)
+    counts = np.where(isInside, 3, 0)
+    for i, polygon in polygons.items():
+        counts[i] = len(polygon)
+    offsets = np.zeros(len(triangles) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    points = np.empty((offsets[-1], 3), dtype=np.float64)
+    insideIndices = np.flatnonzero(isInside)
+    points[offsets[insideIndices][:, None] + np.arange(3)] = triangles[insideIndices]
+    for i, polygon in polygons.items():
+        points[offsets[i]:offsets[i + 1]] = polygon
+    return (points, offsets)